@@ -0,0 +1,42 @@
+"""add customer orders index
+
+Revision ID: 5f1c2a9d7e3b
+Revises: ac45e60c6efb
+Create Date: 2026-10-18 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2a9d7e3b'
+down_revision: Union[str, None] = 'ac45e60c6efb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so existing tables are not locked against writes
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_order_customer_id_created_at_id',
+            'order',
+            ['customer_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            unique=False,
+            schema='orders',
+            postgresql_include=['product_id', 'quantity', 'price', 'status', 'updated_at'],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_order_customer_id_created_at_id',
+            table_name='order',
+            schema='orders',
+            postgresql_concurrently=True,
+        )
@@ -1,13 +1,149 @@
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Use asyncpg + AsyncSession; DATABASE_URL is converted unless overridden
+    DATABASE_ASYNC: bool = True
+    DATABASE_ASYNC_URL: Optional[str] = None
+    # Connection pool, applied to the primary and to each replica
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800  # seconds, -1 disables
+    DATABASE_POOL_PRE_PING: bool = False
+    # Read replicas for GET endpoints, as a JSON list of sync URLs
+    DATABASE_READ_URLS: list[str] = []
+    # "round_robin" or "least_connections"
+    DATABASE_READ_STRATEGY: str = "round_robin"
+    # After a write, the caller's reads stay on the primary for this long
+    DATABASE_READ_YOUR_WRITES_SECONDS: float = 5.0
+    # Statements slower than this are logged (with parameters stripped)
+    DATABASE_SLOW_QUERY_SECONDS: float = 0.5
+    # Distinct statement fingerprints kept for /api/v1/admin/query-stats
+    DATABASE_QUERY_STATS_SIZE: int = 1000
+    # Flag requests running one fingerprint this many times (N+1 pattern)
+    DATABASE_REPEATED_QUERY_THRESHOLD: int = 10
     LOGGER_NAME: str = "fastapi-orders-service"
     LOGGER_PATH: str = "logs/app.log"
-    METRICS_UPDATE_INTERVAL: int = 30
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    # Records are written by a background thread; 0 writes synchronously
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_BATCH_SIZE: int = 200
+    LOG_FLUSH_INTERVAL: float = 1.0
+    LOG_MAX_BYTES: int = 50 * 1024 * 1024
+    LOG_BACKUP_COUNT: int = 5
+    # Fraction of successful (< 400) requests and of probe requests to log
+    LOG_SAMPLE_RATE_SUCCESS: float = 1.0
+    LOG_SAMPLE_RATE_PROBES: float = 0.0
+    LOG_PROBE_PATHS: list[str] = ["/health", "/metrics"]
+    # How often the event loop lag probe runs, and the lag that gets logged
+    EVENT_LOOP_LAG_INTERVAL: float = 0.5
+    EVENT_LOOP_LAG_WARN_SECONDS: float = 0.1
+    # Cap on distinct route labels in the HTTP metrics, the rest become "other"
+    METRICS_MAX_ENDPOINTS: int = 100
+    # Per-phase request timing histograms, optionally sent as a Server-Timing header
+    REQUEST_TIMING_ENABLED: bool = True
+    SERVER_TIMING_HEADER: bool = True
+    # Response compression, in order of preference among what the client accepts
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_ENCODINGS: list[str] = ["zstd", "br", "gzip"]
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    COMPRESSION_ZSTD_LEVEL: int = 3
+    # Admission control: adaptive concurrency limits per route class
+    # ("read", "write", "export"), each with a bounded wait queue
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_INITIAL_LIMITS: dict[str, int] = {"read": 50, "write": 25, "export": 4}
+    ADMISSION_MAX_LIMITS: dict[str, int] = {"read": 200, "write": 100, "export": 8}
+    ADMISSION_MIN_LIMIT: int = 2
+    # Requests slower than this (seconds) shrink the limit
+    ADMISSION_LATENCY_TARGETS: dict[str, float] = {"read": 0.5, "write": 1.0, "export": 60.0}
+    ADMISSION_DECREASE_FACTOR: float = 0.9
+    ADMISSION_QUEUE_SIZE: int = 100
+    ADMISSION_QUEUE_TIMEOUT: float = 1.0
+    ADMISSION_RETRY_AFTER: int = 1
+    ADMISSION_BYPASS_PATHS: list[str] = ["/health", "/metrics", "/docs", "/redoc", "/openapi.json"]
+    # Request deadlines, in seconds: DEADLINE_HEADER if the client sent it,
+    # otherwise the default of the route class (exports have none), capped
+    # at DEADLINE_MAX. Carried into users-service timeouts and database
+    # statements (cancelled in async mode, statement_timeout in sync mode);
+    # requests are cancelled when their deadline passes or their client
+    # disconnects.
+    DEADLINE_ENABLED: bool = True
+    DEADLINE_HEADER: str = "X-Request-Timeout"
+    DEADLINE_DEFAULTS: dict[str, float] = {"read": 5.0, "write": 10.0}
+    DEADLINE_MAX: float = 60.0
+    # Sync mode only sets statement_timeout (a round trip per transaction)
+    # for transactions starting with less than this many seconds left; keep
+    # it at or below the server's own statement_timeout, which bounds the rest
+    DEADLINE_STATEMENT_TIMEOUT_THRESHOLD: float = 1.0
+    # Per-customer rate limits: token buckets refilled at RATE tokens per
+    # second up to BURST, one per user and kind ("read" or "write")
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_READ_RATE: float = 20.0
+    RATE_LIMIT_READ_BURST: int = 40
+    RATE_LIMIT_WRITE_RATE: float = 5.0
+    RATE_LIMIT_WRITE_BURST: int = 10
+    # "memory" keeps buckets per process (limits are per worker); "redis"
+    # shares them between workers through RATE_LIMIT_REDIS_URL
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_REDIS_URL: Optional[str] = None
+    RATE_LIMIT_SHARDS: int = 16
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    # Read-through cache of single orders. "memory" keeps it per worker
+    # (other workers see a write only once their copy expires); "redis"
+    # shares versioned keys between workers through ORDER_CACHE_REDIS_URL
+    ORDER_CACHE_ENABLED: bool = True
+    ORDER_CACHE_BACKEND: str = "memory"
+    ORDER_CACHE_REDIS_URL: Optional[str] = None
+    ORDER_CACHE_MAX_SIZE: int = 10000
+    ORDER_CACHE_TTL: float = 30.0
+    # Shared directory for per-worker metric files when running several workers
+    METRICS_MULTIPROC_DIR: str = "/tmp/orders-service-metrics"
     APP_NAME: str = "FastAPI Orders Service"
+    # "development" runs one auto-reloading process; "production" runs
+    # SERVER_WORKERS processes (0 = one per CPU) on uvloop/httptools
+    SERVER_MODE: str = "development"
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8001
+    SERVER_WORKERS: int = 0
+    SERVER_GRACEFUL_SHUTDOWN_TIMEOUT: int = 30
     USERS_SERVICE_URL: str
+    USERS_SERVICE_TIMEOUT: float = 10.0
+    USERS_SERVICE_MAX_CONNECTIONS: int = 100
+    USERS_SERVICE_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    USERS_SERVICE_KEEPALIVE_EXPIRY: float = 30.0
+    USERS_SERVICE_HTTP2: bool = False
+    # Users-service verification cache, keyed on (user_id, token fingerprint)
+    USER_CACHE_ENABLED: bool = True
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_POSITIVE_TTL: float = 60.0
+    USER_CACHE_NEGATIVE_TTL: float = 5.0
+    # "remote": trust the users-service, "local": verify JWT signatures here
+    AUTH_MODE: str = "remote"
+    JWT_SECRET: Optional[str] = None
+    JWT_ALGORITHMS: list[str] = ["HS256"]
+    JWT_AUDIENCE: Optional[str] = None
+    JWT_ISSUER: Optional[str] = None
+    # http(s) URL or local file path of a JWKS document, takes precedence over JWT_SECRET
+    JWKS_URL: Optional[str] = None
+    JWKS_REFRESH_INTERVAL: float = 300.0
+    VERIFIED_TOKEN_CACHE_SIZE: int = 10000
+    ORDERS_PAGE_SIZE: int = 50
+    ORDERS_PAGE_SIZE_MAX: int = 200
+    ORDERS_BATCH_MAX_SIZE: int = 1000
+    ORDERS_EXPORT_BATCH_SIZE: int = 1000
+    # How long an Idempotency-Key and its stored response are kept (seconds),
+    # and how often / how many expired keys are purged per batch
+    IDEMPOTENCY_KEY_TTL: float = 86400.0
+    IDEMPOTENCY_CLEANUP_INTERVAL: float = 600.0
+    IDEMPOTENCY_CLEANUP_BATCH_SIZE: int = 1000
+    # Users allowed to use admin-only features such as exporting all orders
+    ADMIN_USER_IDS: list[int] = []
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from typing import Optional
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.engine import Row
+from app.database import DbSession, commit, execute
+from app.models.idempotency_key import IdempotencyKey
+
+
+idempotency_table = IdempotencyKey.__table__
+
+
+def _this_key(customer_id: int, key: str):
+    return (idempotency_table.c.customer_id == customer_id) & (idempotency_table.c.key == key)
+
+
+async def get_idempotency_record(db: DbSession, customer_id: int, key: str) -> Optional[Row]:
+    """
+    The stored request and response for a customer's key, unless it expired
+    """
+    stmt = select(
+        idempotency_table.c.request_hash,
+        idempotency_table.c.token_hash,
+        idempotency_table.c.status_code,
+        idempotency_table.c.response_body,
+        idempotency_table.c.response_headers,
+    ).where(_this_key(customer_id, key), idempotency_table.c.expires_at > func.now())
+    result = await execute(db, stmt)
+    return result.first()
+
+
+async def claim_idempotency_key(
+    db: DbSession, customer_id: int, key: str, request_hash: str, token_hash: str, ttl: float
+) -> bool:
+    """
+    Insert the key in the current transaction (or take over an expired
+    one), returning False when it is already taken
+
+    While the claiming transaction is open, other claims of the same key
+    block on its row, so a concurrent duplicate waits for the first
+    request to commit (then finds its response) or roll back (then runs).
+    """
+    values = {
+        "customer_id": customer_id,
+        "key": key,
+        "request_hash": request_hash,
+        "token_hash": token_hash,
+        "expires_at": func.now() + timedelta(seconds=ttl),
+    }
+    stmt = insert(idempotency_table).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[idempotency_table.c.customer_id, idempotency_table.c.key],
+        set_={
+            **{name: stmt.excluded[name] for name in ("request_hash", "token_hash", "expires_at")},
+            "status_code": None,
+            "response_body": None,
+            "response_headers": None,
+            "created_at": func.now(),
+        },
+        where=idempotency_table.c.expires_at <= func.now(),
+    ).returning(idempotency_table.c.customer_id)
+    result = await execute(db, stmt)
+    return result.first() is not None
+
+
+async def store_idempotent_response(
+    db: DbSession, customer_id: int, key: str, status_code: int, body: bytes, headers: dict
+) -> None:
+    """
+    Record the response of a claimed key; committed by the caller together
+    with the work it describes
+    """
+    stmt = update(idempotency_table).where(_this_key(customer_id, key)).values(
+        status_code=status_code, response_body=body, response_headers=headers
+    )
+    await execute(db, stmt)
+
+
+async def delete_expired_idempotency_keys(db: DbSession, batch_size: int) -> int:
+    """
+    Delete up to batch_size expired keys, returning how many were deleted
+    """
+    expired = (
+        select(idempotency_table.c.customer_id, idempotency_table.c.key)
+        .where(idempotency_table.c.expires_at <= func.now())
+        .order_by(idempotency_table.c.expires_at)
+        .limit(batch_size)
+    )
+    stmt = delete(idempotency_table).where(
+        tuple_(idempotency_table.c.customer_id, idempotency_table.c.key).in_(expired)
+    )
+    result = await execute(db, stmt)
+    await commit(db)
+    return result.rowcount
@@ -1,66 +1,201 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from sqlalchemy import delete, func, insert, select, tuple_, update
+from sqlalchemy.engine import Row, RowMapping
+from app.database import DbSession, commit, execute, stream_partitions
 from app.models.order import Order
 from app.schemas.order import OrderCreate, OrderRead, OrderUpdate
 
 
-def create_order(db: Session, order: OrderCreate) -> Order:
+# Writes go through the Core table with RETURNING so each one is a single
+# statement and nothing is loaded into the session's identity map
+orders_table = Order.__table__
+
+# Columns in OrderRead's field order, for rows serialized with orders_json
+order_read_columns = [orders_table.c[field] for field in OrderRead.model_fields]
+
+
+def _order_values(order: OrderCreate) -> dict:
+    return {
+        "customer_id": order.customer_id,
+        "product_id": order.product_id,
+        "quantity": order.quantity,
+        "price": order.price,
+        "status": order.status or "pending",
+    }
+
+
+async def create_order(db: DbSession, order: OrderCreate, in_transaction: bool = False) -> Row:
+    """
+    Create a new order in the database, returned as a row in
+    order_read_columns order
+
+    With in_transaction the caller commits, together with its own writes.
+    """
+    stmt = insert(orders_table).values(_order_values(order)).returning(*order_read_columns)
+    result = await execute(db, stmt)
+    created = result.one()
+    if not in_transaction:
+        await commit(db)
+    return created
+
+
+async def create_orders(db: DbSession, orders: list[OrderCreate]) -> list[Row]:
+    """
+    Create several orders in one transaction
+
+    The rows go out as multi-row INSERT ... RETURNING statements (SQLAlchemy
+    pages very large batches) and come back in the same order as `orders`,
+    with columns in order_read_columns order.
+    """
+    values = [_order_values(order) for order in orders]
+    stmt = insert(orders_table).returning(*order_read_columns, sort_by_parameter_order=True)
+    result = await execute(db, stmt, values)
+    created = list(result.all())
+    await commit(db)
+    return created
+
+
+async def get_order_row(db: DbSession, order_id: int) -> Optional[Row]:
+    """
+    Get an order by ID as a row in order_read_columns order, ready for
+    order_json
+    """
+    result = await execute(db, select(*order_read_columns).where(orders_table.c.id == order_id))
+    return result.first()
+
+
+async def get_order_version(db: DbSession, order_id: int) -> Optional[Row]:
     """
-    Create a new order in the database
+    Just the owner and updated_at of an order, enough to check an ETag
     """
-    db_order = Order(
-        customer_id=order.customer_id,
-        product_id=order.product_id,
-        quantity=order.quantity,
-        price=order.price,
-        status=order.status or "pending"
+    stmt = select(orders_table.c.customer_id, orders_table.c.updated_at).where(
+        orders_table.c.id == order_id
     )
-    db.add(db_order)
-    db.commit()
-    db.refresh(db_order)
-    return db_order
+    result = await execute(db, stmt)
+    return result.first()
+
 
+def _user_page(columns, user_id: int, limit: int, after: Optional[tuple[datetime, int]]):
+    stmt = select(*columns).where(orders_table.c.customer_id == user_id)
+    if after is not None:
+        stmt = stmt.where(tuple_(orders_table.c.created_at, orders_table.c.id) < tuple_(*after))
+    return stmt.order_by(orders_table.c.created_at.desc(), orders_table.c.id.desc()).limit(limit)
 
-def get_order(db: Session, order_id: int) -> Order:
+
+async def get_orders_page_summary(
+    db: DbSession,
+    user_id: int,
+    limit: int,
+    after: Optional[tuple[datetime, int]] = None,
+) -> tuple[int, Optional[datetime], int]:
     """
-    Get an order by ID
+    (row count, newest updated_at, sum of ids) of the page get_orders_by_user
+    would return, computed in the database from the covering index alone
     """
-    return db.query(Order).filter(Order.id == order_id).first()
+    page = _user_page([orders_table.c.id, orders_table.c.updated_at], user_id, limit, after).subquery()
+    stmt = select(func.count(), func.max(page.c.updated_at), func.coalesce(func.sum(page.c.id), 0))
+    result = await execute(db, stmt)
+    count, last_updated_at, id_sum = result.one()
+    return count, last_updated_at, int(id_sum)
 
 
-def get_orders_by_user(db: Session, user_id: int) -> list[Order]:
+async def get_orders_by_user(
+    db: DbSession,
+    user_id: int,
+    limit: int,
+    after: Optional[tuple[datetime, int]] = None,
+) -> list[Row]:
     """
-    Get all orders for a specific user (using customer_id as user identifier)
+    Get a page of orders for a specific user (using customer_id as user identifier),
+    newest first. `after` is the (created_at, id) of the last order of the
+    previous page; the row comparison lets postgres seek the composite index
+    instead of scanning and skipping.
+
+    Plain rows in order_read_columns order are returned, not ORM objects.
     """
-    return db.query(Order).filter(Order.customer_id == user_id).all()
+    result = await execute(db, _user_page(order_read_columns, user_id, limit, after))
+    return list(result.all())
 
 
-def update_order(db: Session, order_id: int, user_id: int, order_update: OrderUpdate) -> Order:
+async def stream_orders(
+    db: DbSession,
+    batch_size: int,
+    customer_id: Optional[int] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+) -> AsyncIterator[list]:
     """
-    Update an order (only if it belongs to the user)
+    Stream orders as plain rows in batches, oldest first
+
+    `customer_id=None` exports every customer's orders (admin only).
+    """
+    stmt = select(*orders_table.c)
+    if customer_id is not None:
+        stmt = stmt.where(orders_table.c.customer_id == customer_id)
+    if status is not None:
+        stmt = stmt.where(orders_table.c.status == status)
+    if created_from is not None:
+        stmt = stmt.where(orders_table.c.created_at >= created_from)
+    if created_to is not None:
+        stmt = stmt.where(orders_table.c.created_at < created_to)
+    stmt = stmt.order_by(orders_table.c.created_at, orders_table.c.id)
+    async for partition in stream_partitions(db, stmt, batch_size):
+        yield partition
+
+
+async def update_order(
+    db: DbSession,
+    order_id: int,
+    user_id: int,
+    order_update: OrderUpdate,
+    updated_at_in: Optional[list[datetime]] = None,
+) -> Optional[RowMapping]:
+    """
+    Update an order (only if it belongs to the user and, when
+    `updated_at_in` is given, was last updated at one of those times)
+
+    Returns None when the order does not exist, belongs to someone else or
+    was modified since.
     """
-    db_order = db.query(Order).filter(Order.id == order_id, Order.customer_id == user_id).first()
-    if not db_order:
-        return None
-    
     # Update only provided fields
-    update_data = order_update.model_dump(exclude_unset=True)
-    for field, value in update_data.items():
-        if value is not None:
-            setattr(db_order, field, value)
-    
-    db.commit()
-    db.refresh(db_order)
-    return db_order
-
-
-def delete_order(db: Session, order_id: int, user_id: int) -> bool:
-    """
-    Delete an order (only if it belongs to the user)
-    """
-    db_order = db.query(Order).filter(Order.id == order_id, Order.customer_id == user_id).first()
-    if not db_order:
-        return False
-    
-    db.delete(db_order)
-    db.commit()
-    return True
\ No newline at end of file
+    update_data = {
+        field: value
+        for field, value in order_update.model_dump(exclude_unset=True).items()
+        if value is not None
+    }
+    ownership = (orders_table.c.id == order_id, orders_table.c.customer_id == user_id)
+    if updated_at_in is not None:
+        ownership += (orders_table.c.updated_at.in_(updated_at_in),)
+    if not update_data:
+        result = await execute(db, select(*orders_table.c).where(*ownership))
+        return result.mappings().first()
+
+    stmt = update(orders_table).where(*ownership).values(update_data).returning(*orders_table.c)
+    result = await execute(db, stmt)
+    updated = result.mappings().first()
+    await commit(db)
+    return updated
+
+
+async def delete_order(
+    db: DbSession,
+    order_id: int,
+    user_id: int,
+    updated_at_in: Optional[list[datetime]] = None,
+) -> bool:
+    """
+    Delete an order (only if it belongs to the user and, when
+    `updated_at_in` is given, was last updated at one of those times)
+    """
+    stmt = delete(orders_table).where(
+        orders_table.c.id == order_id, orders_table.c.customer_id == user_id
+    )
+    if updated_at_in is not None:
+        stmt = stmt.where(orders_table.c.updated_at.in_(updated_at_in))
+    stmt = stmt.returning(orders_table.c.id)
+    result = await execute(db, stmt)
+    deleted = result.first() is not None
+    await commit(db)
+    return deleted
@@ -1,32 +1,333 @@
+import asyncio
+import itertools
 import time
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Union
+from fastapi import Depends
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
 from app.core.settings import settings
-from app.middleware.metrics_middleware import DATABASE_QUERY_DURATION
+from app.dependencies.auth import get_current_user
+from app.middleware.metrics_middleware import (
+    DATABASE_POOL_CHECKED_OUT,
+    DATABASE_POOL_CHECKOUT_TIMEOUTS,
+    DATABASE_POOL_CHECKOUT_WAIT,
+    DATABASE_POOL_OVERFLOW,
+    DATABASE_QUERY_DURATION,
+    DATABASE_SLOW_QUERIES,
+)
 from app.models.base import Base
+from app.utils.deadlines import apply_statement_timeout, statement_deadline
+from app.utils.logger import get_logger
+from app.utils.query_stats import QueryStats, fingerprint
+from app.utils.request_timing import record_phase, record_statement
+
+
+# Either session flavour can be handed to the CRUD layer
+DbSession = Union[Session, AsyncSession]
+
+sql_logger = get_logger(f"{settings.LOGGER_NAME}.sql")
+
+# Per-fingerprint statistics for every engine of this process
+query_stats = QueryStats(settings.DATABASE_QUERY_STATS_SIZE)
 
 
 def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    context._query_start_time = time.time()
+    context._query_start_time = time.perf_counter()
 
-def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
-    elapsed = time.time() - context._query_start_time
-    query_type = statement.split()[0].lower()  # naive extraction: select/insert/update/delete
-    DATABASE_QUERY_DURATION.labels(query_type=query_type).observe(elapsed)
+def query_timer(engine_name: str):
+    """
+    Build the after_cursor_execute hook for one engine, so query timings
+    can be told apart per primary/replica
+    """
+    slow_queries = DATABASE_SLOW_QUERIES.labels(engine=engine_name)
 
-# Create database engine
-engine = create_engine(settings.DATABASE_URL)
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start_time
+        query_type = statement.split()[0].lower()  # naive extraction: select/insert/update/delete
+        DATABASE_QUERY_DURATION.labels(query_type=query_type, engine=engine_name).observe(elapsed)
+        record_phase("db", elapsed)
 
-event.listen(engine, "before_cursor_execute", before_cursor_execute)
-event.listen(engine, "after_cursor_execute", after_cursor_execute)
+        query = fingerprint(statement)
+        rows = max(cursor.rowcount, 0)
+        query_stats.record(query, elapsed, rows)
+        record_statement(query)
+        if elapsed >= settings.DATABASE_SLOW_QUERY_SECONDS:
+            slow_queries.inc()
+            # The fingerprint carries no literals or bound parameter values
+            sql_logger.warning(
+                "Slow query on %s took %.4fs (%s rows): %s",
+                engine_name, elapsed, rows, query,
+                extra={"engine": engine_name, "duration": elapsed, "rows": rows, "fingerprint": query},
+            )
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return after_cursor_execute
 
-# Dependency to get database session
-def get_db():
-    db = SessionLocal()
+
+def instrumented_pool(base: type, engine_name: str) -> type:
+    """
+    Subclass a queue pool so checkout waits and timeouts are measured;
+    pools have no "before checkout" event to hook into instead
+    """
+    wait = DATABASE_POOL_CHECKOUT_WAIT.labels(engine=engine_name)
+    timeouts = DATABASE_POOL_CHECKOUT_TIMEOUTS.labels(engine=engine_name)
+
+    class InstrumentedPool(base):
+        def _do_get(self):
+            start_time = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                timeouts.inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - start_time
+                wait.observe(elapsed)
+                record_phase("db_checkout", elapsed)
+
+    return InstrumentedPool
+
+
+def pool_options() -> dict:
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+
+
+def async_database_url(url: str) -> str:
+    """
+    Swap the driver of a sync postgres URL (psycopg2) for asyncpg
+    """
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(
+        hide_password=False
+    )
+
+
+class Database:
+    """
+    One database server (the primary or a read replica) with its engine and
+    session factory in the configured sync/async mode
+    """
+
+    def __init__(self, name: str, url: str, async_url: Optional[str] = None):
+        self.name = name
+        if settings.DATABASE_ASYNC:
+            self.async_engine = create_async_engine(
+                async_url or async_database_url(url),
+                poolclass=instrumented_pool(AsyncAdaptedQueuePool, name),
+                **pool_options(),
+            )
+            # Cursor events are only dispatched on the sync facade of the async engine
+            self.engine = self.async_engine.sync_engine
+            self.sessionmaker = async_sessionmaker(
+                self.async_engine, autoflush=False, expire_on_commit=False
+            )
+        else:
+            self.async_engine = None
+            self.engine = create_engine(
+                url, poolclass=instrumented_pool(QueuePool, name), **pool_options()
+            )
+            self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+        event.listen(self.engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(self.engine, "after_cursor_execute", query_timer(name))
+
+        # Counted here rather than read off the pool: checkin fires before
+        # the connection is actually handed back
+        self._in_use = 0
+        self._checked_out = DATABASE_POOL_CHECKED_OUT.labels(engine=name)
+        self._overflow = DATABASE_POOL_OVERFLOW.labels(engine=name)
+        event.listen(self.engine, "checkout", self._on_checkout)
+        event.listen(self.engine, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self._in_use += 1
+        self._checked_out.set(self._in_use)
+        self._overflow.set(max(self._in_use - settings.DATABASE_POOL_SIZE, 0))
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self._in_use -= 1
+        self._checked_out.set(self._in_use)
+        self._overflow.set(max(self._in_use - settings.DATABASE_POOL_SIZE, 0))
+
+    def checked_out(self) -> int:
+        return self.engine.pool.checkedout()
+
+    async def dispose(self) -> None:
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        else:
+            self.engine.dispose()
+
+
+# Async statements are cancelled at the deadline by execute() instead
+if settings.DEADLINE_ENABLED and not settings.DATABASE_ASYNC:
+    event.listen(Session, "after_begin", apply_statement_timeout)
+
+# Create database engines
+primary = Database("primary", settings.DATABASE_URL, settings.DATABASE_ASYNC_URL)
+replicas = [
+    Database(f"replica-{index}", url)
+    for index, url in enumerate(settings.DATABASE_READ_URLS)
+]
+
+engine = primary.engine
+async_engine = primary.async_engine
+SessionLocal = primary.sessionmaker
+
+_round_robin = itertools.count()
+# user_id -> monotonic time until which that user's reads stay on the primary
+_recent_writes: dict[int, float] = {}
+
+
+def record_write(user_id: int) -> None:
+    """
+    Pin the user's reads to the primary for DATABASE_READ_YOUR_WRITES_SECONDS,
+    so they do not read stale data from a lagging replica
+    """
+    if not replicas:
+        return
+    now = time.monotonic()
+    if len(_recent_writes) >= 10000:
+        for key, until in list(_recent_writes.items()):
+            if until <= now:
+                del _recent_writes[key]
+    _recent_writes[user_id] = now + settings.DATABASE_READ_YOUR_WRITES_SECONDS
+
+
+def read_database(user_id: Optional[int] = None) -> Database:
+    """
+    Pick the database to serve a read from
+    """
+    if not replicas:
+        return primary
+    if user_id is not None:
+        until = _recent_writes.get(user_id)
+        if until is not None:
+            if until > time.monotonic():
+                return primary
+            del _recent_writes[user_id]
+    if settings.DATABASE_READ_STRATEGY == "least_connections":
+        return min(replicas, key=Database.checked_out)
+    return replicas[next(_round_robin) % len(replicas)]
+
+
+@asynccontextmanager
+async def session_scope(database: Database = primary) -> AsyncIterator[DbSession]:
+    """
+    Open a session of the configured flavour outside of request dependencies
+    (e.g. inside a streaming response body)
+    """
+    if settings.DATABASE_ASYNC:
+        async with database.sessionmaker() as db:
+            yield db
+        return
+
+    db = database.sessionmaker()
     try:
         yield db
     finally:
-        db.close()
+        # shield: the session is closed even if the request is cancelled again
+        await asyncio.shield(close_session(db))
+
+
+async def run_blocking(db: Session, func, *args):
+    """
+    Run a blocking call on a sync session in the threadpool
+
+    A cancelled caller stops waiting, but the call goes on in its thread;
+    it is left on the session so that nothing else uses the session (from
+    another thread) before it is over, see finish_running_call().
+    """
+    call = asyncio.ensure_future(run_in_threadpool(func, *args))
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        db.info["running_call"] = call
+        raise
+
+
+async def finish_running_call(db: Session) -> None:
+    """
+    Wait for the call a cancelled caller left running on the session
+    """
+    call = db.info.pop("running_call", None)
+    if call is not None:
+        # Its outcome is of no use to anyone anymore
+        await asyncio.gather(call, return_exceptions=True)
+
+
+async def close_session(db: Session) -> None:
+    await finish_running_call(db)
+    # Closing rolls back and returns the connection, which is blocking I/O
+    await run_in_threadpool(db.close)
+
+
+# Dependency to get database session
+async def get_db() -> AsyncIterator[DbSession]:
+    async with session_scope() as db:
+        yield db
+
+
+# Dependency to get a session for read-only work, served by a replica when configured
+async def get_read_db(current_user: dict = Depends(get_current_user)) -> AsyncIterator[DbSession]:
+    async with session_scope(read_database(current_user["user_id"])) as db:
+        yield db
+
+
+async def execute(db: DbSession, statement, params=None):
+    """
+    Execute a statement without blocking the event loop in either session mode
+    """
+    if isinstance(db, AsyncSession):
+        async with statement_deadline():
+            return await db.execute(statement, params)
+    return await run_blocking(db, db.execute, statement, params)
+
+
+async def stream_partitions(db: DbSession, statement, size: int) -> AsyncIterator[list]:
+    """
+    Yield rows in lists of `size` from a server-side cursor, so memory stays
+    flat regardless of the result size
+    """
+    statement = statement.execution_options(yield_per=size)
+    if isinstance(db, AsyncSession):
+        result = await db.stream(statement)
+        async for partition in result.partitions():
+            yield partition
+        return
+
+    result = await run_blocking(db, db.execute, statement)
+    partitions = result.partitions()
+    try:
+        while True:
+            partition = await run_blocking(db, next, partitions, None)
+            if partition is None:
+                break
+            yield partition
+    finally:
+        await finish_running_call(db)
+        await run_in_threadpool(result.close)
+
+
+async def commit(db: DbSession) -> None:
+    if isinstance(db, AsyncSession):
+        await db.commit()
+    else:
+        await run_blocking(db, db.commit)
+
+
+async def dispose_engines() -> None:
+    """
+    Close pooled connections on application shutdown
+    """
+    for database in [primary, *replicas]:
+        await database.dispose()
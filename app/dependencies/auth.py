@@ -1,41 +1,109 @@
+import hashlib
+import time
 from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import jwt
 from app.core.settings import settings
+from app.services.jwks_service import jwks_cache
+from app.utils.request_timing import record_phase
+from app.utils.ttl_cache import MISSING, TTLCache
 
 security = HTTPBearer()
 
+# Tokens whose signature was already checked, kept until they expire
+verified_tokens = TTLCache(
+    name="verified_tokens",
+    max_size=settings.VERIFIED_TOKEN_CACHE_SIZE,
+    ttl=0,
+)
+
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def _signing_key(token: str):
+    if jwks_cache is None:
+        if not settings.JWT_SECRET:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Token verification is not configured",
+            )
+        return settings.JWT_SECRET
+
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = await jwks_cache.get_key(kid)
+    if key is None:
+        raise _unauthorized("Invalid token: unknown signing key")
+    return key
+
+
+async def _verify_locally(token: str) -> dict:
+    """
+    Verify the token signature and claims without calling the users-service
+    """
+    cache_key = hashlib.sha256(token.encode()).hexdigest()
+    user_id = verified_tokens.get(cache_key)
+    if user_id is not MISSING:
+        return {"user_id": user_id, "token": token, "verified": True}
+
+    payload = jwt.decode(
+        token,
+        await _signing_key(token),
+        algorithms=settings.JWT_ALGORITHMS,
+        audience=settings.JWT_AUDIENCE,
+        issuer=settings.JWT_ISSUER,
+        options={"require": ["exp", "sub"]},
+    )
+    user_id = int(payload["sub"])
+    verified_tokens.set(cache_key, user_id, ttl=payload["exp"] - time.time())
+    return {"user_id": user_id, "token": token, "verified": True}
+
+
+def is_admin(current_user: dict) -> bool:
+    return current_user["user_id"] in settings.ADMIN_USER_IDS
+
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
     """
     Validate JWT token and extract user information
+
+    In "local" AUTH_MODE the signature is verified here and the result is
+    flagged as verified, so callers can skip the users-service round trip.
     """
+    start_time = time.perf_counter()
+    try:
+        return await _authenticate(credentials)
+    finally:
+        record_phase("auth", time.perf_counter() - start_time)
+
+
+async def _authenticate(credentials: HTTPAuthorizationCredentials) -> dict:
     try:
         token = credentials.credentials
+        if settings.AUTH_MODE == "local":
+            return await _verify_locally(token)
+
         payload = jwt.decode(token, options={"verify_signature": False})
-        
+
         user_id = payload.get("sub")
         if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token: missing user ID",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        
+            raise _unauthorized("Invalid token: missing user ID")
+
         return {
             "user_id": int(user_id),
-            "token": token  # Include the raw token for secure API calls
+            "token": token,  # Include the raw token for secure API calls
+            "verified": False,
         }
-    
+
     except jwt.ExpiredSignatureError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    except jwt.InvalidTokenError:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+        raise _unauthorized("Token has expired")
+    except jwt.MissingRequiredClaimError as e:
+        raise _unauthorized(f"Invalid token: missing {e.claim} claim")
+    except (jwt.InvalidTokenError, ValueError):
+        raise _unauthorized("Invalid token")
@@ -0,0 +1,78 @@
+from fastapi import Depends, HTTPException, Request, status
+from app.core.settings import settings
+from app.dependencies.auth import get_current_user
+from app.middleware.metrics_middleware import RATE_LIMIT_STORE_ERRORS, RATE_LIMITED
+from app.utils.logger import get_logger
+from app.utils.rate_limiter import (
+    MemoryTokenBucketStore,
+    RedisTokenBucketStore,
+    retry_seconds,
+)
+
+logger = get_logger(f"{settings.LOGGER_NAME}.rate_limit")
+
+# kind -> (rate in tokens per second, burst)
+LIMITS = {
+    "read": (settings.RATE_LIMIT_READ_RATE, settings.RATE_LIMIT_READ_BURST),
+    "write": (settings.RATE_LIMIT_WRITE_RATE, settings.RATE_LIMIT_WRITE_BURST),
+}
+
+
+def _build_store():
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        if not settings.RATE_LIMIT_REDIS_URL:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires RATE_LIMIT_REDIS_URL")
+        return RedisTokenBucketStore(settings.RATE_LIMIT_REDIS_URL)
+    return MemoryTokenBucketStore(settings.RATE_LIMIT_SHARDS, settings.RATE_LIMIT_MAX_KEYS)
+
+
+rate_limit_store = _build_store() if settings.RATE_LIMIT_ENABLED else None
+
+
+async def take_rate_limit(request: Request, kind: str, user_id: int, cost: int = 1) -> None:
+    """
+    Take `cost` tokens from the user's `kind` bucket ("read" or "write"),
+    rejecting the request with 429 and Retry-After when there are not
+    enough; a request costing more than the whole bucket is let through
+    when the bucket is full, leaving it in debt
+
+    The decision is left in request.state.rate_limit, from which
+    RateLimitHeadersMiddleware adds the RateLimit-* headers to whatever
+    response the request ends up with.
+    """
+    if rate_limit_store is None:
+        return
+    rate, burst = LIMITS[kind]
+    try:
+        decision = await rate_limit_store.take(f"{kind}:{user_id}", rate, burst, cost)
+    except Exception as e:
+        # A broken shared store must not take the service down with it
+        RATE_LIMIT_STORE_ERRORS.inc()
+        logger.warning("Rate limit store failed, allowing request: %s", e)
+        return
+
+    request.state.rate_limit = decision
+    if not decision.allowed:
+        RATE_LIMITED.labels(kind=kind).inc()
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(retry_seconds(decision.retry_after))},
+        )
+
+
+def rate_limit(kind: str):
+    """
+    Dependency taking one token from the caller's `kind` bucket; endpoints
+    whose requests cost more call take_rate_limit() themselves
+    """
+
+    async def check_rate_limit(request: Request, current_user: dict = Depends(get_current_user)):
+        await take_rate_limit(request, kind, current_user["user_id"])
+
+    return check_rate_limit
+
+
+async def close_rate_limit_store() -> None:
+    if rate_limit_store is not None:
+        await rate_limit_store.close()
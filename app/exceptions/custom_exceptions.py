@@ -29,3 +29,10 @@ class ValidationException(HTTPException):
         super().__init__(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail
         )
+
+
+class DeadlineExceededException(HTTPException):
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=detail
+        )
@@ -0,0 +1,102 @@
+import time
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
+from app.middleware.metrics_middleware import (
+    ADMISSION_LIMIT,
+    ADMISSION_QUEUED,
+    ADMISSION_SHED,
+)
+from app.utils.adaptive_limiter import AdaptiveLimiter
+
+
+WRITE_METHODS = frozenset(["POST", "PUT", "PATCH", "DELETE"])
+
+
+def route_class(scope: Scope) -> str:
+    """
+    Which limiter a request goes through: "export" for the long-running
+    streaming exports, "write" for mutating methods, "read" otherwise
+    """
+    if scope["path"].rstrip("/").endswith("/export"):
+        return "export"
+    if scope["method"] in WRITE_METHODS:
+        return "write"
+    return "read"
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI admission control: each route class has an adaptive
+    concurrency limit (see AdaptiveLimiter) and a bounded wait queue.
+    Requests beyond that are rejected straight away with 503 and
+    Retry-After, instead of piling up until everything times out.
+
+    ADMISSION_BYPASS_PATHS (health checks, metrics) are never limited.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.bypass_paths = tuple(path.rstrip("/") for path in settings.ADMISSION_BYPASS_PATHS)
+        self.limiters = {
+            name: AdaptiveLimiter(
+                initial=settings.ADMISSION_INITIAL_LIMITS[name],
+                minimum=settings.ADMISSION_MIN_LIMIT,
+                maximum=settings.ADMISSION_MAX_LIMITS[name],
+                target=settings.ADMISSION_LATENCY_TARGETS[name],
+                queue_size=settings.ADMISSION_QUEUE_SIZE,
+                queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+                decrease_factor=settings.ADMISSION_DECREASE_FACTOR,
+            )
+            for name in ("read", "write", "export")
+        }
+        for name, limiter in self.limiters.items():
+            ADMISSION_LIMIT.labels(route_class=name).set(int(limiter.limit))
+
+    def _bypassed(self, path: str) -> bool:
+        path = path.rstrip("/")
+        return any(
+            path == bypass or path.startswith(bypass + "/") for bypass in self.bypass_paths
+        )
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, name: str, reason: str):
+        ADMISSION_SHED.labels(route_class=name, reason=reason).inc()
+        response = JSONResponse(
+            status_code=503,
+            content={"detail": "Service is overloaded, please retry later"},
+            headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER)},
+        )
+        await response(scope, receive, send)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or self._bypassed(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope)
+        limiter = self.limiters[name]
+        queued = ADMISSION_QUEUED.labels(route_class=name)
+
+        queued.inc()
+        try:
+            admitted = await limiter.acquire()
+        finally:
+            queued.dec()
+        if admitted != "admitted":
+            await self._reject(scope, receive, send, name, admitted)
+            return
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            limiter.release(time.perf_counter() - start_time, ok=status_code < 500)
+            ADMISSION_LIMIT.labels(route_class=name).set(int(limiter.limit))
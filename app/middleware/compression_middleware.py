@@ -0,0 +1,224 @@
+import zlib
+from typing import Callable, Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
+from app.middleware.metrics_middleware import RESPONSE_BODY_BYTES, endpoint_label
+from app.utils.etags import encoded_etag
+
+try:
+    import brotli
+except ImportError:  # optional: br is simply not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional: zstd is simply not offered
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = frozenset([
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+])
+
+
+class GzipEncoder:
+    def __init__(self):
+        # wbits=31: zlib stream wrapped in a gzip header and trailer
+        self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self):
+        self._compressor = zstandard.ZstdCompressor(
+            level=settings.COMPRESSION_ZSTD_LEVEL
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+ENCODERS: dict[str, Callable] = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+
+def accepted_encodings(header: str) -> dict[str, float]:
+    """
+    Parse Accept-Encoding into {coding: q}
+    """
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """
+    The first of COMPRESSION_ENCODINGS (our order of preference) that the
+    client accepts, or None to send the response as is
+    """
+    accepted = accepted_encodings(header)
+    wildcard = accepted.get("*", 0.0)
+    for coding in settings.COMPRESSION_ENCODINGS:
+        if coding in ENCODERS and accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI response compression negotiated through Accept-Encoding
+    (zstd, br or gzip, depending on what is installed and accepted)
+
+    Complete responses are compressed only from COMPRESSION_MIN_SIZE bytes
+    on. Streaming responses are compressed chunk by chunk, each chunk
+    flushed so the client receives it right away. Responses that already
+    carry a Content-Encoding (e.g. /metrics) are passed through. Strong
+    ETags of compressed responses get the coding appended (encoded_etag),
+    and so do those of 304 responses to a client holding the compressed one.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # (endpoint, encoding) -> (bytes in child, bytes out child)
+        self._children: dict[tuple[str, str], tuple] = {}
+
+    def _count(self, scope: Scope, encoding: str, bytes_in: int, bytes_out: int) -> None:
+        key = (endpoint_label(scope), encoding)
+        children = self._children.get(key)
+        if children is None:
+            children = (
+                RESPONSE_BODY_BYTES.labels(endpoint=key[0], encoding=encoding, stage="in"),
+                RESPONSE_BODY_BYTES.labels(endpoint=key[0], encoding=encoding, stage="out"),
+            )
+            self._children[key] = children
+        children[0].inc(bytes_in)
+        children[1].inc(bytes_out)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self._passthrough(scope, receive, send)
+            return
+
+        start_message: Optional[Message] = None
+        encoder = None
+        bytes_in = bytes_out = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal start_message, encoder, bytes_in, bytes_out
+
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows how big the body is
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            bytes_in += len(body)
+
+            if start_message is not None:
+                headers = MutableHeaders(scope=start_message)
+                if "content-encoding" not in headers and is_compressible(headers.get("content-type", "")):
+                    headers.add_vary_header("Accept-Encoding")
+                    if more_body or len(body) >= settings.COMPRESSION_MIN_SIZE:
+                        encoder = ENCODERS[encoding]()
+                        headers["Content-Encoding"] = encoding
+                        if "content-length" in headers:
+                            del headers["content-length"]
+                        if "etag" in headers:
+                            headers["ETag"] = encoded_etag(headers["etag"], encoding)
+                elif start_message["status"] == 304 and "etag" in headers:
+                    headers.add_vary_header("Accept-Encoding")
+                    etag = encoded_etag(headers["etag"], encoding)
+                    if etag in request_headers.get("if-none-match", ""):
+                        headers["ETag"] = etag
+                if encoder is not None:
+                    body = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+                    if not more_body:
+                        headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                start_message = None
+            elif encoder is not None:
+                body = encoder.compress(body) + (encoder.flush() if more_body else encoder.finish())
+
+            bytes_out += len(body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+            if not more_body:
+                self._count(scope, encoding if encoder is not None else "identity", bytes_in, bytes_out)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _passthrough(self, scope: Scope, receive: Receive, send: Send):
+        bytes_out = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal bytes_out
+            if message["type"] == "http.response.body":
+                bytes_out += len(message.get("body", b""))
+                if not message.get("more_body", False):
+                    self._count(scope, "identity", bytes_out, bytes_out)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
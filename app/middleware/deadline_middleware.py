@@ -0,0 +1,164 @@
+import asyncio
+import math
+import time
+from typing import Optional
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
+from app.middleware.admission_middleware import route_class
+from app.middleware.metrics_middleware import DEADLINE_EXCEEDED, REQUESTS_CANCELLED, endpoint_label
+from app.utils.deadlines import current_deadline
+
+
+# Reported (metrics, logs) for requests whose client went away; never
+# reaches the client
+CLIENT_CLOSED_REQUEST = 499
+
+# The request task is only cancelled this long after the deadline, giving
+# the users-service and database timeouts derived from it the chance to
+# fail the request first (they release their connections more cleanly)
+CANCEL_GRACE = 0.1
+
+
+def _expects_body(scope: Scope) -> bool:
+    headers = Headers(scope=scope)
+    return "transfer-encoding" in headers or headers.get("content-length", "0") not in ("", "0")
+
+
+class DeadlineMiddleware:
+    """
+    Pure ASGI middleware giving every request a deadline and cancelling the
+    work done for it once it is of no use to anyone
+
+    The deadline comes from DEADLINE_HEADER or DEADLINE_DEFAULTS, and is
+    published in current_deadline for the users-service client and the
+    database sessions to shorten their own timeouts. The application runs
+    in its own task, which is cancelled when the deadline passes (504 if
+    nothing was sent yet) or when the client disconnects (reported as 499).
+
+    Disconnects are only listened for once the request body has been read,
+    so the application still receives the body as it streams in (requests
+    without Content-Length or Transfer-Encoding have an empty body).
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    def _deadline(self, scope: Scope) -> Optional[float]:
+        timeout = settings.DEADLINE_DEFAULTS.get(route_class(scope))
+        header = Headers(scope=scope).get(settings.DEADLINE_HEADER)
+        if header:
+            try:
+                value = float(header)
+            except ValueError:
+                value = math.nan
+            # nan and inf would slip past the clamping below
+            if math.isfinite(value):
+                timeout = value
+        if timeout is None:
+            return None
+        return time.monotonic() + min(max(timeout, 0.0), settings.DEADLINE_MAX)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        deadline = self._deadline(scope)
+        token = current_deadline.set(deadline)
+        try:
+            await self._run(scope, receive, send, deadline)
+        finally:
+            current_deadline.reset(token)
+
+    async def _run(self, scope: Scope, receive: Receive, send: Send, deadline: Optional[float]):
+        # Resolved with the http.disconnect message once the client is gone
+        disconnected = asyncio.get_running_loop().create_future()
+        body_pending = _expects_body(scope)
+        # Requests without a body get it from us; the server's (empty)
+        # http.request message is consumed by the watcher instead
+        empty_body_owed = not body_pending
+        response_started = response_complete = False
+        app_task: Optional[asyncio.Task] = None
+        watcher: Optional[asyncio.Task] = None
+
+        def on_disconnect(message: Message) -> None:
+            if not disconnected.done():
+                disconnected.set_result(message)
+            if not response_complete:
+                app_task.cancel()
+
+        async def watch_disconnect(skip_body: bool):
+            message = await receive()
+            if skip_body and message["type"] == "http.request":
+                # The empty body of a request without one, which the
+                # application got from receive_wrapper
+                message = await receive()
+            if message["type"] == "http.disconnect":
+                on_disconnect(message)
+            # Any other message breaks the ASGI protocol; stop listening
+            # rather than spin on a receive() that never waits
+
+        def start_watching(skip_body: bool = False) -> None:
+            nonlocal watcher
+            watcher = asyncio.create_task(watch_disconnect(skip_body))
+
+        async def receive_wrapper() -> Message:
+            nonlocal body_pending, empty_body_owed
+            if empty_body_owed:
+                empty_body_owed = False
+                return {"type": "http.request", "body": b"", "more_body": False}
+            if not body_pending:
+                # shield: a cancelled listener must not resolve it for everyone
+                return await asyncio.shield(disconnected)
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                on_disconnect(message)
+            elif not message.get("more_body", False):
+                body_pending = False
+                start_watching()
+            return message
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started, response_complete
+            if message["type"] == "http.response.start":
+                response_started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response_complete = True
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, receive_wrapper, send_wrapper))
+        if not body_pending:
+            start_watching(skip_body=True)
+        expired = False
+        try:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0) + CANCEL_GRACE
+            await asyncio.wait({app_task}, timeout=timeout)
+            if not app_task.done():
+                expired = True
+                app_task.cancel()
+                await asyncio.wait({app_task})
+        except asyncio.CancelledError:
+            app_task.cancel()
+            raise
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+        if not app_task.cancelled():
+            # Re-raises whatever the application raised
+            app_task.result()
+            return
+
+        if expired:
+            DEADLINE_EXCEEDED.labels(stage="request").inc()
+            if not response_started:
+                response = JSONResponse(status_code=504, content={"detail": "Request deadline exceeded"})
+                await response(scope, receive, send)
+            return
+
+        REQUESTS_CANCELLED.labels(endpoint=endpoint_label(scope)).inc()
+        if not response_started:
+            await send({"type": "http.response.start", "status": CLIENT_CLOSED_REQUEST, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
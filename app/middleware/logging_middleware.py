@@ -1,52 +1,79 @@
-import time
 import logging
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+import random
+import time
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
+from app.utils.logger import get_logger
+
+
+class LoggingMiddleware:
+    """
+    Pure ASGI access logging: one line per request, written when
+    http.response.start is sent, along with the X-Process-Time header.
 
+    Successful requests and probe endpoints (health checks, scrapes) are
+    sampled according to settings; error responses are always logged.
+    """
 
-class LoggingMiddleware(BaseHTTPMiddleware):
     def __init__(self, app: ASGIApp):
-        super().__init__(app)
-        self.logger = logging.getLogger(__name__)
+        self.app = app
+        self.logger = get_logger(f"{settings.LOGGER_NAME}.requests")
+        self.probe_paths = frozenset(path.rstrip("/") for path in settings.LOG_PROBE_PATHS)
+
+    def _should_log(self, path: str, status_code: int) -> bool:
+        if status_code >= 400:
+            return True
+        if path.rstrip("/") in self.probe_paths:
+            sample_rate = settings.LOG_SAMPLE_RATE_PROBES
+        else:
+            sample_rate = settings.LOG_SAMPLE_RATE_SUCCESS
+        return sample_rate >= 1.0 or random.random() < sample_rate
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    async def dispatch(self, request: Request, call_next):
-        # Log request
         start_time = time.time()
-        
-        # Get client IP
-        client_ip = request.client.host if request.client else "unknown"
-        
-        # Log request details
-        self.logger.info(
-            f"Request: {request.method} {request.url.path} "
-            f"from {client_ip} - User-Agent: {request.headers.get('user-agent', 'unknown')}"
-        )
-        
+        method = scope["method"]
+        path = scope["path"]
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                # Calculate processing time
+                process_time = time.time() - start_time
+                status_code = message["status"]
+
+                if self.logger.isEnabledFor(logging.INFO) and self._should_log(path, status_code):
+                    client = scope.get("client")
+                    client_ip = client[0] if client else "unknown"
+                    user_agent = Headers(scope=scope).get("user-agent", "unknown")
+                    self.logger.info(
+                        "%s %s %s from %s took %.4fs - User-Agent: %s",
+                        method, path, status_code, client_ip, process_time, user_agent,
+                        extra={
+                            "method": method,
+                            "path": path,
+                            "status": status_code,
+                            "duration": process_time,
+                            "client_ip": client_ip,
+                            "user_agent": user_agent,
+                        },
+                    )
+
+                # Add processing time to response headers
+                MutableHeaders(scope=message)["X-Process-Time"] = str(process_time)
+            await send(message)
+
         # Process request
         try:
-            response = await call_next(request)
-            
-            # Calculate processing time
-            process_time = time.time() - start_time
-            
-            # Log response
-            self.logger.info(
-                f"Response: {response.status_code} "
-                f"for {request.method} {request.url.path} "
-                f"took {process_time:.4f}s"
-            )
-            
-            # Add processing time to response headers
-            response.headers["X-Process-Time"] = str(process_time)
-            
-            return response
-            
+            await self.app(scope, receive, send_wrapper)
+
         except Exception as e:
             # Log error
             process_time = time.time() - start_time
             self.logger.error(
-                f"Error processing {request.method} {request.url.path}: {str(e)} "
-                f"took {process_time:.4f}s"
+                "Error processing %s %s: %s took %.4fs", method, path, e, process_time
             )
-            raise 
\ No newline at end of file
+            raise
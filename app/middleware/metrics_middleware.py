@@ -1,7 +1,7 @@
 import time
 from prometheus_client import Counter, Histogram, Gauge
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
 
 
 REQUEST_COUNT = Counter(
@@ -17,8 +17,23 @@ REQUEST_DURATION = Histogram(
     buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
 )
 
+REQUEST_PHASE_DURATION = Histogram(
+    "http_request_phase_duration_seconds",
+    "Time spent per request in each phase (auth, users_service, db_checkout, db, render)",
+    ["endpoint", "phase"],
+    buckets=[0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+)
+
+RESPONSE_BODY_BYTES = Counter(
+    "http_response_body_bytes_total",
+    "Response body bytes by route and content encoding, as produced (stage=in) and as sent (stage=out)",
+    ["endpoint", "encoding", "stage"],
+)
+
 TOTAL_ACTIVE_REQUESTS = Gauge(
-    "http_requests_in_flight", "Total number of in-flight HTTP requests"
+    "http_requests_in_flight",
+    "Total number of in-flight HTTP requests",
+    multiprocess_mode="livesum",
 )
 
 TOTAL_PAYMENT_ERRORS = Counter(
@@ -27,55 +42,250 @@ TOTAL_PAYMENT_ERRORS = Counter(
     ["error_type"],
 )
 
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_requests_total",
+    "Order creations with an Idempotency-Key by outcome (created, replayed, mismatch)",
+    ["result"],
+)
+IDEMPOTENCY_KEYS_PURGED = Counter(
+    "idempotency_keys_purged_total",
+    "Expired idempotency keys deleted",
+)
 ORDERS_CREATED_TOTAL = Counter(
     "orders_created_total",
     "Total number of orders created",
 )
 
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit",
+    "Current adaptive concurrency limit by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+
+ADMISSION_QUEUED = Gauge(
+    "admission_queued_requests",
+    "Requests waiting for an admission slot by route class",
+    ["route_class"],
+    multiprocess_mode="livesum",
+)
+
+ADMISSION_SHED = Counter(
+    "admission_shed_requests_total",
+    "Requests rejected with 503 by route class and reason (queue_full, timeout)",
+    ["route_class", "reason"],
+)
+DEADLINE_EXCEEDED = Counter(
+    "request_deadline_exceeded_total",
+    "Requests that ran out of their deadline, by where it was noticed (request, users_service, database)",
+    ["stage"],
+)
+REQUESTS_CANCELLED = Counter(
+    "http_requests_cancelled_total",
+    "Requests cancelled because the client disconnected before the response was complete",
+    ["endpoint"],
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429 by the per-customer rate limit, by kind (read, write)",
+    ["kind"],
+)
+RATE_LIMIT_STORE_ERRORS = Counter(
+    "rate_limit_store_errors_total",
+    "Rate limit store failures (the request was let through)",
+)
+
 DATABASE_QUERY_DURATION = Histogram(
     "database_query_duration_seconds",
     "Database query duration in seconds",
-    ["query_type"],
+    ["query_type", "engine"],
     buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
 )
 
+DATABASE_SLOW_QUERIES = Counter(
+    "database_slow_queries_total",
+    "Statements slower than DATABASE_SLOW_QUERY_SECONDS",
+    ["engine"],
+)
 
-class MetricsMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app: ASGIApp):
-        super().__init__(app)
+REQUEST_DB_STATEMENTS = Histogram(
+    "http_request_db_statements",
+    "SQL statements executed per request",
+    ["endpoint"],
+    buckets=[0, 1, 2, 3, 5, 10, 20, 50, 100, 250],
+)
 
-    async def dispatch(self, request, call_next):
-        TOTAL_ACTIVE_REQUESTS.inc()
+REPEATED_QUERY_REQUESTS = Counter(
+    "http_requests_repeated_queries_total",
+    "Requests that ran one statement fingerprint at least DATABASE_REPEATED_QUERY_THRESHOLD times",
+    ["endpoint"],
+)
 
-        start_time = time.perf_counter()
-        endpoint = request.url.path
+DATABASE_POOL_CHECKED_OUT = Gauge(
+    "database_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
 
-        try:
-            response = await call_next(request)
+DATABASE_POOL_OVERFLOW = Gauge(
+    "database_pool_overflow_connections",
+    "Overflow connections in use beyond pool_size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
 
-            duration = time.perf_counter() - start_time
-            REQUEST_DURATION.labels(
-                method=request.method, endpoint=endpoint
-            ).observe(duration)
+DATABASE_POOL_CHECKOUT_WAIT = Histogram(
+    "database_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection (including connecting)",
+    ["engine"],
+    buckets=[0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+)
+
+DATABASE_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "database_pool_checkout_timeouts_total",
+    "Pool checkouts that gave up after pool_timeout",
+    ["engine"],
+)
 
-            REQUEST_COUNT.labels(
-                method=request.method,
-                endpoint=endpoint,
-                status=response.status_code,
-            ).inc()
+USERS_SERVICE_REQUEST_DURATION = Histogram(
+    "users_service_request_duration_seconds",
+    "Users-service request duration in seconds by response status",
+    ["status"],
+    buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0],
+)
 
-            return response
+# Each request holds a pooled connection, so this is the pool's usage
+# (out of USERS_SERVICE_MAX_CONNECTIONS per worker)
+USERS_SERVICE_REQUESTS_IN_FLIGHT = Gauge(
+    "users_service_requests_in_flight",
+    "Users-service requests in flight",
+    multiprocess_mode="livesum",
+)
 
-        except Exception as _:  # noqa
-            duration = time.perf_counter() - start_time
-            REQUEST_DURATION.labels(
-                method=request.method, endpoint=endpoint
-            ).observe(duration)
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total",
+    "In-process cache lookups by cache and result (hit, miss, coalesced)",
+    ["cache", "result"],
+)
+
+CACHE_EVICTIONS = Counter(
+    "cache_evictions_total",
+    "In-process cache evictions by cache and reason (expired, size)",
+    ["cache", "reason"],
+)
+CACHE_BACKEND_ERRORS = Counter(
+    "cache_backend_errors_total",
+    "Shared cache backend failures by cache and operation (read, write, invalidate)",
+    ["cache", "operation"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How much later than scheduled the event loop ran the lag probe",
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0],
+)
+
+GC_PAUSE_DURATION = Histogram(
+    "python_gc_pause_seconds",
+    "Garbage collection pause duration by generation",
+    ["generation"],
+    buckets=[0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25],
+)
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full",
+)
+
+
+HTTP_METHODS = frozenset(
+    ["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE", "CONNECT"]
+)
+
+# Route templates seen so far; once METRICS_MAX_ENDPOINTS is reached, any
+# new one is reported as "other" so the number of series stays bounded
+_endpoints: set[str] = set()
+
+
+def endpoint_label(scope: Scope) -> str:
+    """
+    Label a finished request by its matched route template
+    (e.g. /api/v1/orders/{order_id}) instead of the raw path.
+
+    Must be called after the request went through the router, which is what
+    stores the matched route (or the mount's root_path) in the scope.
+    """
+    route = scope.get("route")
+    if route is not None:
+        endpoint = route.path
+    elif scope.get("app_root_path") is not None and scope.get("root_path"):
+        # Requests handled by a mounted app, such as /metrics
+        endpoint = scope["root_path"]
+    else:
+        return "other"
 
-            REQUEST_COUNT.labels(
-                method=request.method, endpoint=endpoint, status=500
-            ).inc()
+    if endpoint not in _endpoints:
+        if len(_endpoints) >= settings.METRICS_MAX_ENDPOINTS:
+            return "other"
+        _endpoints.add(endpoint)
+    return endpoint
 
-            raise
+
+def method_label(scope: Scope) -> str:
+    method = scope["method"]
+    return method if method in HTTP_METHODS else "OTHER"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: the status code is taken from the
+    http.response.start message, so the response body is passed through
+    untouched (streaming keeps working) and no extra task is spawned
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # (method, endpoint, status) -> (duration child, count child), so the
+        # hot path is one dict lookup instead of two label resolutions
+        self._children: dict[tuple[str, str, int], tuple] = {}
+
+    def _label_children(self, method: str, endpoint: str, status_code: int) -> tuple:
+        key = (method, endpoint, status_code)
+        children = self._children.get(key)
+        if children is None:
+            children = (
+                REQUEST_DURATION.labels(method=method, endpoint=endpoint),
+                REQUEST_COUNT.labels(method=method, endpoint=endpoint, status=status_code),
+            )
+            self._children[key] = children
+        return children
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        TOTAL_ACTIVE_REQUESTS.inc()
+
+        start_time = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            # Stays 500 if the app raises before starting a response
+            await self.app(scope, receive, send_wrapper)
         finally:
+            duration = time.perf_counter() - start_time
+            request_duration, request_count = self._label_children(
+                method_label(scope), endpoint_label(scope), status_code
+            )
+            request_duration.observe(duration)
+            request_count.inc()
+
             TOTAL_ACTIVE_REQUESTS.dec()
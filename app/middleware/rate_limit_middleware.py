@@ -0,0 +1,48 @@
+import math
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.utils.rate_limiter import RateLimitDecision
+
+
+def rate_limit_headers(decision: RateLimitDecision) -> dict[str, str]:
+    """
+    RateLimit-* headers (IETF httpapi-ratelimit-headers draft) for a
+    RateLimitDecision
+    """
+    return {
+        "RateLimit-Limit": str(decision.limit),
+        "RateLimit-Remaining": str(decision.remaining),
+        "RateLimit-Reset": str(math.ceil(decision.reset_after)),
+        "RateLimit-Policy": f"{decision.limit};w={math.ceil(decision.window)}",
+    }
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Pure ASGI middleware adding RateLimit-* headers to rate limited requests
+
+    The rate_limit dependency runs inside the endpoint, but its headers
+    cannot go through the usual sub-response: FastAPI drops those when the
+    endpoint returns a Response itself (304s, pre-serialized lists) or
+    raises. So the dependency leaves its decision in the request state and
+    the headers are added here, to every response.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                decision = scope.get("state", {}).get("rate_limit")
+                if decision is not None:
+                    headers = MutableHeaders(scope=message)
+                    for name, value in rate_limit_headers(decision).items():
+                        headers[name] = value
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
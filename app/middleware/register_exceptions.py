@@ -1,14 +1,17 @@
 from fastapi import Request
 from fastapi.responses import JSONResponse
+from sqlalchemy.exc import DBAPIError
 from app.exceptions.custom_exceptions import (
     UserNotFoundException,
     UserAlreadyExistsException,
     DatabaseException,
 )
-from app.utils.logger import setup_logger
-logger = setup_logger(
-    name="fastapi-users-service", log_level="INFO", log_file="logs/app.log"
-)
+from app.middleware.metrics_middleware import DEADLINE_EXCEEDED
+from app.core.settings import settings
+from app.utils.deadlines import is_statement_timeout
+from app.utils.logger import get_logger
+# Propagates to the service logger configured in main.py
+logger = get_logger(f"{settings.LOGGER_NAME}.exceptions")
 
 
 class RegisterExceptionsMiddleware:
@@ -28,6 +31,9 @@ class RegisterExceptionsMiddleware:
         self.app.add_exception_handler(
             DatabaseException, self.database_exception_handler
         )
+        self.app.add_exception_handler(
+            DBAPIError, self.statement_timeout_exception_handler
+        )
 
     async def user_not_found_exception_handler(
         self, request: Request, exc: UserNotFoundException
@@ -52,3 +58,16 @@ class RegisterExceptionsMiddleware:
         return JSONResponse(
             status_code=exc.status_code, content={"detail": exc.detail}
         )
+
+    async def statement_timeout_exception_handler(
+        self, request: Request, exc: DBAPIError
+    ):
+        # Only the statement_timeout set from the request deadline is
+        # handled here, other database errors stay unhandled (500)
+        if not is_statement_timeout(exc):
+            raise exc
+        DEADLINE_EXCEEDED.labels(stage="database").inc()
+        logger.warning(f"Statement cancelled at the request deadline: {request.url.path}")
+        return JSONResponse(
+            status_code=504, content={"detail": "Request deadline exceeded"}
+        )
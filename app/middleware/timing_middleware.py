@@ -0,0 +1,97 @@
+import time
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.settings import settings
+from app.middleware.metrics_middleware import (
+    REPEATED_QUERY_REQUESTS,
+    REQUEST_DB_STATEMENTS,
+    REQUEST_PHASE_DURATION,
+    endpoint_label,
+)
+from app.utils.logger import get_logger
+from app.utils.query_stats import repeated_queries
+from app.utils.request_timing import RequestTimings, current_timings
+
+
+logger = get_logger(f"{settings.LOGGER_NAME}.sql")
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    """
+    Render the phases as a Server-Timing header value (durations in ms)
+    """
+    entries = []
+    for phase, seconds in timings.phases.items():
+        entry = f"{phase};dur={seconds * 1000:.2f}"
+        count = timings.counts[phase]
+        if count > 1:
+            entry += f';desc="{count}x"'
+        entries.append(entry)
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware collecting the per-phase breakdown of each request.
+
+    Phases are recorded into the request's RequestTimings by the code doing
+    the work (see record_phase); here they are reported as a Server-Timing
+    header and as per-route histograms once the request is done. Requests
+    repeating one statement many times (N+1 queries) are flagged as well.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # (endpoint, phase) -> histogram child
+        self._children: dict[tuple[str, str], object] = {}
+
+    def _observe(self, endpoint: str, phase: str, seconds: float) -> None:
+        key = (endpoint, phase)
+        child = self._children.get(key)
+        if child is None:
+            child = REQUEST_PHASE_DURATION.labels(endpoint=endpoint, phase=phase)
+            self._children[key] = child
+        child.observe(seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start_time = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start":
+                now = time.perf_counter()
+                if timings.endpoint_done is not None:
+                    timings.add("render", now - timings.endpoint_done)
+                if settings.SERVER_TIMING_HEADER:
+                    MutableHeaders(scope=message)["Server-Timing"] = server_timing(
+                        timings, now - start_time
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_timings.reset(token)
+            endpoint = endpoint_label(scope)
+            for phase, seconds in timings.phases.items():
+                self._observe(endpoint, phase, seconds)
+            self._check_statements(endpoint, timings.statements)
+
+    def _check_statements(self, endpoint: str, statements: dict[str, int]) -> None:
+        REQUEST_DB_STATEMENTS.labels(endpoint=endpoint).observe(sum(statements.values()))
+        repeated = repeated_queries(statements, settings.DATABASE_REPEATED_QUERY_THRESHOLD)
+        if repeated is None:
+            return
+        query, count = repeated
+        REPEATED_QUERY_REQUESTS.labels(endpoint=endpoint).inc()
+        logger.warning(
+            "Possible N+1 on %s: statement ran %s times in one request: %s",
+            endpoint, count, query,
+            extra={"endpoint": endpoint, "count": count, "fingerprint": query},
+        )
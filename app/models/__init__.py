@@ -1,2 +1,3 @@
 from app.models.base import Base  # noqa
 from app.models.order import Order  # noqa
+from app.models.idempotency_key import IdempotencyKey  # noqa
@@ -0,0 +1,31 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import DateTime, Index, LargeBinary, String, func
+
+from app.models.base import Base
+
+
+class IdempotencyKey(Base):
+    customer_id: Mapped[int] = mapped_column(primary_key=True)
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # sha256 of the request payload; a key reused for another payload is rejected
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # sha256 of the bearer token, so only the same token replays without
+    # being checked against the users-service again
+    token_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    # The stored response; written in the transaction that claimed the key
+    status_code: Mapped[Optional[int]] = mapped_column(nullable=True)
+    response_body: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    response_headers: Mapped[Optional[dict]] = mapped_column(JSONB, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=func.now()
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+# Expired keys are purged in batches, oldest first
+Index("ix_idempotencykey_expires_at", IdempotencyKey.expires_at)
@@ -1,6 +1,6 @@
 from datetime import datetime
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import DateTime, String, func
+from sqlalchemy import DateTime, Index, String, func
 
 from app.models.base import Base
 
@@ -28,3 +28,14 @@ class Order(Base):
         server_default=func.now(),
         onupdate=func.now()
     )
+
+
+# Keyset pagination of a customer's orders walks this index newest first;
+# the remaining columns are included so listing is an index-only scan.
+Index(
+    "ix_order_customer_id_created_at_id",
+    Order.customer_id,
+    Order.created_at.desc(),
+    Order.id.desc(),
+    postgresql_include=["product_id", "quantity", "price", "status", "updated_at"],
+)
@@ -0,0 +1,48 @@
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.core.settings import settings
+from app.database import query_stats
+from app.dependencies.auth import get_current_user, is_admin
+from app.routes.orders import ensure_user_exists
+from app.utils.request_timing import TimedRoute
+
+
+admin_router = APIRouter(prefix="/admin", tags=["admin"], route_class=TimedRoute)
+
+
+async def require_admin(current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    Only let users listed in ADMIN_USER_IDS through
+    """
+    await ensure_user_exists(current_user)
+    if not is_admin(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied: admin rights required"
+        )
+    return current_user
+
+
+@admin_router.get("/query-stats")
+async def get_query_stats(
+    limit: int = Query(20, ge=1, le=settings.DATABASE_QUERY_STATS_SIZE),
+    sort: Literal["total", "mean", "max", "calls", "rows"] = "total",
+    current_user: dict = Depends(require_admin),
+):
+    """
+    Top statement fingerprints of this worker process, by total time
+    (or mean/max time, calls or rows). Times are in seconds.
+    """
+    return {
+        "slow_query_threshold": settings.DATABASE_SLOW_QUERY_SECONDS,
+        "queries": query_stats.top(limit, sort),
+    }
+
+
+@admin_router.delete("/query-stats")
+async def reset_query_stats(current_user: dict = Depends(require_admin)):
+    """
+    Start collecting statement statistics from scratch
+    """
+    query_stats.reset()
+    return {"message": "Query statistics reset"}
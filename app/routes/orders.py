@@ -1,42 +1,117 @@
 from app.schemas.order import OrderCreate, OrderRead, OrderPayload, OrderUpdate
-from app.dependencies.auth import get_current_user
+from app.dependencies.auth import get_current_user, is_admin
+from app.dependencies.rate_limit import rate_limit, take_rate_limit
+from app.crud.idempotency import claim_idempotency_key, get_idempotency_record, store_idempotent_response
 from app.crud.orders import (
     create_order as crud_create_order, 
-    get_order, 
+    create_orders as crud_create_orders,
+    get_order_row,
+    get_order_version,
     get_orders_by_user,
+    get_orders_page_summary,
+    orders_table,
+    stream_orders,
     update_order as crud_update_order,
     delete_order as crud_delete_order
 )
+from app.services.idempotency import replay_response, request_hash, token_hash
+from app.services.order_cache import get_order_cached, invalidate_order, order_database
 from app.services.user_service import verify_user_exists
-from app.database import get_db
-from app.middleware.metrics_middleware import ORDERS_CREATED_TOTAL
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from app.core.settings import settings
+from app.database import DbSession, commit, get_db, get_read_db, read_database, record_write, session_scope
+from app.middleware.metrics_middleware import IDEMPOTENT_REQUESTS, ORDERS_CREATED_TOTAL
+from app.utils.etags import expected_versions, none_match, order_etag, orders_list_etag, rows_list_etag
+from app.utils.exporters import EXPORT_MEDIA_TYPES, csv_chunks, ndjson_chunks
+from app.utils.pagination import decode_cursor, encode_cursor
+from app.utils.request_timing import TimedRoute
+from app.utils.responses import OrderListResponse, OrderResponse, order_json, orders_json
+from datetime import datetime
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from typing import Literal, Optional
 from pydantic import BaseModel
 
 
-order_router = APIRouter(prefix="/orders", tags=["orders"])
+order_router = APIRouter(prefix="/orders", tags=["orders"], route_class=TimedRoute)
 
 
-@order_router.post("/", response_model=OrderRead)
+async def ensure_user_exists(current_user: dict) -> None:
+    """
+    Check the caller against the users-service, unless the token was
+    already verified locally (AUTH_MODE=local)
+    """
+    if current_user.get("verified"):
+        return
+    user_exists = await verify_user_exists(current_user["user_id"], current_user["token"])
+    if not user_exists:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found in users service"
+        )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+async def raise_write_failed(db: DbSession, order_id: int, user_id: int, checked_version: bool) -> None:
+    """
+    Tell apart why a conditional write matched no row: 412 if the caller's
+    order is still there (so its If-Match version was stale), 404 otherwise
+    """
+    if checked_version:
+        version = await get_order_version(db, order_id)
+        if version is not None and version.customer_id == user_id:
+            raise HTTPException(
+                status_code=status.HTTP_412_PRECONDITION_FAILED,
+                detail="Order was modified since it was read"
+            )
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Order not found or access denied"
+    )
+
+
+@order_router.post("/", response_model=OrderRead, dependencies=[Depends(rate_limit("write"))])
 async def create_order(
     order: OrderPayload, 
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
     """
     Create a new order with user verification and database persistence
+
+    With an Idempotency-Key header, the response is stored with the key and
+    a retry with the same key and payload gets it back (marked with
+    Idempotent-Replayed: true) instead of creating another order. A retry
+    arriving while the first request is still running waits for it.
     """
     user_id = current_user["user_id"]
-    token = current_user.get("token")  # Get the raw token from current_user
+    
+    if idempotency_key is not None:
+        payload_hash = request_hash(order.model_dump_json())
+        caller_token_hash = token_hash(current_user["token"])
+        stored = await get_idempotency_record(db, user_id, idempotency_key)
+        # Don't hold a connection while the users-service is called
+        await commit(db)
+        if stored is not None:
+            if stored.token_hash != caller_token_hash:
+                await ensure_user_exists(current_user)
+            return replay_response(stored, payload_hash)
     
     # Verify user exists in users-service
-    user_exists = await verify_user_exists(user_id, token)
-    if not user_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in users service"
+    await ensure_user_exists(current_user)
+    
+    if idempotency_key is not None:
+        claimed = await claim_idempotency_key(
+            db, user_id, idempotency_key, payload_hash, caller_token_hash, settings.IDEMPOTENCY_KEY_TTL
         )
+        if not claimed:
+            # A duplicate got there first and committed (we waited for it)
+            stored = await get_idempotency_record(db, user_id, idempotency_key)
+            await commit(db)
+            return replay_response(stored, payload_hash)
     
     # Create order data
     order_data = OrderCreate(
@@ -47,61 +122,177 @@ async def create_order(
         status=order.status or "pending"
     )
     
-    # Save to database
-    db_order = crud_create_order(db=db, order=order_data)
+    # Save to database; with a key, in the transaction that claimed it
+    db_order = await crud_create_order(db=db, order=order_data, in_transaction=idempotency_key is not None)
+    body = order_json(db_order)
+    headers = {"ETag": order_etag(db_order.id, db_order.updated_at)}
+    if idempotency_key is not None:
+        await store_idempotent_response(db, user_id, idempotency_key, status.HTTP_200_OK, body, headers)
+        await commit(db)
+        IDEMPOTENT_REQUESTS.labels(result="created").inc()
+    record_write(user_id)
     
     # Increment orders created metric
     ORDERS_CREATED_TOTAL.inc()
     
-    return db_order
+    return OrderResponse(body, headers=headers)
+
+
+@order_router.post("/batch", response_model=list[OrderRead])
+async def create_orders_batch(
+    request: Request,
+    orders: list[OrderPayload] = Body(..., min_length=1, max_length=settings.ORDERS_BATCH_MAX_SIZE),
+    current_user: dict = Depends(get_current_user),
+    db: DbSession = Depends(get_db)
+):
+    """
+    Create several orders at once for the current user
+
+    The caller is verified once and all orders are inserted in a single
+    transaction; the created orders are returned in request order. Every
+    order costs a write token; a batch larger than the write burst needs
+    a full bucket, and the caller's next writes wait for the refill.
+    """
+    user_id = current_user["user_id"]
+    await take_rate_limit(request, "write", user_id, cost=len(orders))
+    
+    # Verify user exists in users-service
+    await ensure_user_exists(current_user)
+    
+    orders_data = [
+        OrderCreate(
+            customer_id=user_id,
+            product_id=order.product_id,
+            quantity=order.quantity,
+            price=order.price,
+            status=order.status or "pending"
+        )
+        for order in orders
+    ]
+    
+    created_orders = await crud_create_orders(db=db, orders=orders_data)
+    record_write(user_id)
+    
+    ORDERS_CREATED_TOTAL.inc(len(created_orders))
+    
+    return OrderListResponse(orders_json(created_orders))
 
 
-@order_router.get("/", response_model=list[OrderRead])
+@order_router.get("/", response_model=list[OrderRead], dependencies=[Depends(rate_limit("read"))])
 async def get_user_orders(
+    limit: int = Query(settings.ORDERS_PAGE_SIZE, ge=1, le=settings.ORDERS_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_read_db)
 ):
     """
-    Get all orders for the current authenticated user
+    Get orders for the current authenticated user, newest first
+
+    Results are paginated; when more orders exist the opaque cursor for the
+    next page is returned in the X-Next-Cursor header. The page's ETag can
+    be sent back in If-None-Match to get a 304 while nothing on it changed.
     """
     user_id = current_user["user_id"]
-    token = current_user.get("token")
     
     # Verify user exists in users-service
-    user_exists = await verify_user_exists(user_id, token)
-    if not user_exists:
+    await ensure_user_exists(current_user)
+    
+    after = decode_cursor(cursor) if cursor else None
+
+    if if_none_match:
+        # Only count and checksum the page, from the covering index
+        summary = await get_orders_page_summary(db=db, user_id=user_id, limit=limit + 1, after=after)
+        etag = orders_list_etag(user_id, *summary)
+        if none_match(if_none_match, etag):
+            return not_modified(etag)
+
+    # Fetch one extra row to know whether another page exists
+    orders = await get_orders_by_user(db=db, user_id=user_id, limit=limit + 1, after=after)
+    headers = {"ETag": rows_list_etag(user_id, orders)}
+    if len(orders) > limit:
+        orders = orders[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1].created_at, orders[-1].id)
+    return OrderListResponse(orders_json(orders), headers=headers)
+
+
+@order_router.get("/export", dependencies=[Depends(rate_limit("read"))])
+async def export_orders(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    status_filter: Optional[str] = Query(None, alias="status"),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    all_customers: bool = False,
+    current_user: dict = Depends(get_current_user),
+):
+    """
+    Stream the current user's orders (or, for admins, every customer's
+    orders with all_customers=true) as NDJSON or CSV
+
+    Rows are read from a server-side cursor and written out batch by batch,
+    so memory use does not grow with the size of the export.
+    """
+    user_id = current_user["user_id"]
+    
+    # Verify user exists in users-service
+    await ensure_user_exists(current_user)
+    
+    if all_customers and not is_admin(current_user):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in users service"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied: exporting all orders requires admin rights"
         )
     
-    # Get user's orders
-    orders = get_orders_by_user(db=db, user_id=user_id)
-    return orders
+    async def rows():
+        # The request's session is closed before the body is streamed,
+        # so the export holds its own for as long as it runs
+        async with session_scope(read_database(user_id)) as db:
+            async for partition in stream_orders(
+                db=db,
+                batch_size=settings.ORDERS_EXPORT_BATCH_SIZE,
+                customer_id=None if all_customers else user_id,
+                status=status_filter,
+                created_from=created_from,
+                created_to=created_to,
+            ):
+                yield partition
+    
+    if format == "csv":
+        content = csv_chunks(rows(), orders_table.c.keys())
+    else:
+        content = ndjson_chunks(rows())
+    
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
 
 
-@order_router.get("/{order_id}", response_model=OrderRead)
+@order_router.get("/{order_id}", response_model=OrderRead, dependencies=[Depends(rate_limit("read"))])
 async def get_order_details(
     order_id: int,
-    current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user)
 ):
     """
     Get details of a specific order (only if it belongs to the current user)
+
+    Orders are served from the order cache when possible (a session is only
+    opened on a miss). Sending the order's ETag in If-None-Match returns 304
+    while it is unchanged.
     """
     user_id = current_user["user_id"]
-    token = current_user.get("token")
     
     # Verify user exists in users-service
-    user_exists = await verify_user_exists(user_id, token)
-    if not user_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in users service"
-        )
+    await ensure_user_exists(current_user)
     
+    async def load_order():
+        async with session_scope(order_database(user_id)) as db:
+            return await get_order_row(db=db, order_id=order_id)
+
     # Get order
-    order = get_order(db=db, order_id=order_id)
+    order = await get_order_cached(order_id, load_order)
     if not order:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -115,68 +306,71 @@ async def get_order_details(
             detail="Access denied: This order does not belong to you"
         )
     
-    return order
+    etag = order_etag(order_id, order.updated_at)
+    if if_none_match and none_match(if_none_match, etag):
+        return not_modified(etag)
+    return OrderResponse(order.payload, headers={"ETag": etag})
 
 
-@order_router.put("/{order_id}", response_model=OrderRead)
+@order_router.put("/{order_id}", response_model=OrderRead, dependencies=[Depends(rate_limit("write"))])
 async def update_order(
     order_id: int,
     order_update: OrderUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
     """
     Update an existing order (only if it belongs to the current user)
     Partial updates are supported - only provided fields will be updated
+
+    With If-Match, the update only happens if the order still has that
+    ETag; otherwise 412 is returned.
     """
     user_id = current_user["user_id"]
-    token = current_user.get("token")
     
     # Verify user exists in users-service
-    user_exists = await verify_user_exists(user_id, token)
-    if not user_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in users service"
-        )
+    await ensure_user_exists(current_user)
     
-    # Update order (partial update)
-    updated_order = crud_update_order(db=db, order_id=order_id, user_id=user_id, order_update=order_update)
-    if not updated_order:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found or access denied"
-        )
+    # Update order (partial update), as a compare-and-set on updated_at with If-Match
+    versions = expected_versions(if_match, order_id)
+    updated_order = await crud_update_order(
+        db=db, order_id=order_id, user_id=user_id, order_update=order_update, updated_at_in=versions
+    )
+    if updated_order is None:
+        await raise_write_failed(db, order_id, user_id, checked_version=versions is not None)
+    record_write(user_id)
+    await invalidate_order(order_id)
     
+    response.headers["ETag"] = order_etag(updated_order["id"], updated_order["updated_at"])
     return updated_order
 
 
-@order_router.delete("/{order_id}")
+@order_router.delete("/{order_id}", dependencies=[Depends(rate_limit("write"))])
 async def delete_order(
     order_id: int,
+    if_match: Optional[str] = Header(None),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_db)
 ):
     """
     Delete an order (only if it belongs to the current user)
+
+    With If-Match, the order is only deleted if it still has that ETag;
+    otherwise 412 is returned.
     """
     user_id = current_user["user_id"]
-    token = current_user.get("token")
     
     # Verify user exists in users-service
-    user_exists = await verify_user_exists(user_id, token)
-    if not user_exists:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found in users service"
-        )
+    await ensure_user_exists(current_user)
     
     # Delete order
-    deleted = crud_delete_order(db=db, order_id=order_id, user_id=user_id)
+    versions = expected_versions(if_match, order_id)
+    deleted = await crud_delete_order(db=db, order_id=order_id, user_id=user_id, updated_at_in=versions)
     if not deleted:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Order not found or access denied"
-        )
+        await raise_write_failed(db, order_id, user_id, checked_version=versions is not None)
+    record_write(user_id)
+    await invalidate_order(order_id)
     
     return {"message": "Order deleted successfully"}
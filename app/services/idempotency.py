@@ -0,0 +1,68 @@
+import asyncio
+import hashlib
+from typing import Optional
+from fastapi import HTTPException, Response, status
+from sqlalchemy.engine import Row
+from app.core.settings import settings
+from app.crud.idempotency import delete_expired_idempotency_keys
+from app.database import session_scope
+from app.middleware.metrics_middleware import IDEMPOTENCY_KEYS_PURGED, IDEMPOTENT_REQUESTS
+from app.utils.logger import get_logger
+
+
+logger = get_logger(f"{settings.LOGGER_NAME}.idempotency")
+
+
+def request_hash(payload: str) -> str:
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def token_hash(token: str) -> str:
+    # Never store raw bearer tokens
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def replay_response(stored: Optional[Row], payload_hash: str) -> Response:
+    """
+    The stored response of an idempotency key, marked with
+    Idempotent-Replayed; 422 if the key was used for a different payload
+
+    The caller checks the token (stored.token_hash) before replaying.
+    """
+    if stored is None or stored.status_code is None:
+        # The key expired between our claim and this lookup
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Idempotency-Key is being reused concurrently, please retry"
+        )
+    if stored.request_hash != payload_hash:
+        IDEMPOTENT_REQUESTS.labels(result="mismatch").inc()
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    IDEMPOTENT_REQUESTS.labels(result="replayed").inc()
+    return Response(
+        stored.response_body,
+        status_code=stored.status_code,
+        headers={**(stored.response_headers or {}), "Idempotent-Replayed": "true"},
+        media_type="application/json",
+    )
+
+
+async def purge_expired_keys(interval: float, batch_size: int) -> None:
+    """
+    Delete expired idempotency keys every `interval` seconds, in batches so
+    no single statement holds locks on many rows (runs until cancelled)
+    """
+    while True:
+        try:
+            async with session_scope() as db:
+                while True:
+                    deleted = await delete_expired_idempotency_keys(db, batch_size)
+                    IDEMPOTENCY_KEYS_PURGED.inc(deleted)
+                    if deleted < batch_size:
+                        break
+        except Exception as e:
+            logger.warning("Purging expired idempotency keys failed: %s", e)
+        await asyncio.sleep(interval)
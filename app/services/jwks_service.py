@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+import jwt
+from app.core.settings import settings
+from app.utils.logger import get_logger
+
+
+logger = get_logger(f"{settings.LOGGER_NAME}.auth")
+
+# Unknown key ids trigger a refresh, but not more often than this
+MIN_REFRESH_INTERVAL = 30.0
+
+
+class JWKSCache:
+    """
+    Signing keys from a JWKS document, kept fresh by a background task.
+
+    The source can be an http(s) URL or a local file path (or file:// URL),
+    which keeps the local verification mode testable without an identity
+    provider.
+    """
+
+    def __init__(self, source: str, refresh_interval: float):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self._keys: dict[Optional[str], jwt.PyJWK] = {}
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load_document(self) -> dict:
+        parsed = urlparse(self.source)
+        if parsed.scheme in ("http", "https"):
+            async with httpx.AsyncClient(timeout=settings.USERS_SERVICE_TIMEOUT) as client:
+                response = await client.get(self.source)
+                response.raise_for_status()
+                return response.json()
+
+        path = Path(parsed.path if parsed.scheme == "file" else self.source)
+        return json.loads(await asyncio.to_thread(path.read_text))
+
+    async def refresh(self) -> None:
+        async with self._lock:
+            document = await self._load_document()
+            key_set = jwt.PyJWKSet.from_dict(document)
+            self._keys = {key.key_id: key for key in key_set.keys}
+            self._last_refresh = time.monotonic()
+            logger.info("Loaded %d signing keys from %s", len(self._keys), self.source)
+
+    async def get_key(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        key = self._keys.get(kid)
+        if key is None and kid is None and len(self._keys) == 1:
+            # Single-key documents are commonly used without a kid header
+            key = next(iter(self._keys.values()))
+        if key is not None:
+            return key
+
+        # Possibly a rotated key we have not seen yet
+        if time.monotonic() - self._last_refresh >= MIN_REFRESH_INTERVAL:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning("JWKS refresh from %s failed: %s", self.source, e)
+            return self._keys.get(kid)
+        return None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                # Keep serving with the keys we already have
+                logger.warning("JWKS refresh from %s failed: %s", self.source, e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+jwks_cache = (
+    JWKSCache(settings.JWKS_URL, settings.JWKS_REFRESH_INTERVAL)
+    if settings.JWKS_URL
+    else None
+)
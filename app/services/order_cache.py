@@ -0,0 +1,232 @@
+import itertools
+import secrets
+from datetime import datetime
+from typing import Awaitable, Callable, NamedTuple, Optional
+from app.core.settings import settings
+from app.database import Database, primary, read_database
+from app.middleware.metrics_middleware import CACHE_BACKEND_ERRORS, CACHE_LOOKUPS
+from app.utils.logger import get_logger
+from app.utils.responses import order_json
+from app.utils.ttl_cache import MISSING, TTLCache
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional: only needed for ORDER_CACHE_BACKEND=redis
+    redis = None
+
+
+logger = get_logger(f"{settings.LOGGER_NAME}.order_cache")
+
+
+class CachedOrder(NamedTuple):
+    # Kept next to the payload for ownership checks and ETags
+    customer_id: int
+    updated_at: datetime
+    # OrderRead JSON
+    payload: bytes
+
+
+def cached_order(row) -> CachedOrder:
+    return CachedOrder(row.customer_id, row.updated_at, order_json(row))
+
+
+def _encode(order: CachedOrder) -> bytes:
+    return f"{order.customer_id}|{order.updated_at.isoformat()}\n".encode() + order.payload
+
+
+def _decode(data: bytes) -> CachedOrder:
+    header, _, payload = data.partition(b"\n")
+    customer_id, _, updated_at = header.decode().partition("|")
+    return CachedOrder(int(customer_id), datetime.fromisoformat(updated_at), payload)
+
+
+class MemoryOrderCacheBackend:
+    """
+    Versioned order entries kept in this process
+
+    Implements the same protocol as RedisOrderCacheBackend, so it also
+    stands in for it where no Redis is available.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        # Versions outlive the entries stored under them; an order without
+        # one gets a new version, so an evicted one is never reused
+        self._versions = TTLCache(name="order_versions", max_size=max_size, ttl=ttl * 2)
+        self._entries = TTLCache(name="order_entries", max_size=max_size, ttl=ttl)
+        self._counter = itertools.count(1)
+
+    async def version(self, order_id: int) -> str:
+        version = self._versions.get(order_id)
+        if version is MISSING:
+            version = str(next(self._counter))
+            self._versions.set(order_id, version)
+        return version
+
+    async def bump(self, order_id: int) -> None:
+        self._versions.set(order_id, str(next(self._counter)))
+
+    async def get(self, order_id: int, version: str) -> Optional[CachedOrder]:
+        order = self._entries.get((order_id, version))
+        return None if order is MISSING else order
+
+    async def set(self, order_id: int, version: str, order: CachedOrder) -> None:
+        self._entries.set((order_id, version), order)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisOrderCacheBackend:
+    """
+    Versioned order entries shared by every worker through Redis
+
+    A write replaces the order's version with a new random one, which
+    orphans what any worker stored under the old version. Entries are also
+    kept locally under their version, so a local hit only costs the
+    version lookup.
+    """
+
+    def __init__(self, url: str, max_size: int, ttl: float, prefix: str = "orders:"):
+        if redis is None:
+            raise RuntimeError("ORDER_CACHE_BACKEND=redis requires the redis package")
+        self._client = redis.from_url(url)
+        self._local = TTLCache(name="orders_local", max_size=max_size, ttl=ttl)
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def _version_key(self, order_id: int) -> str:
+        return f"{self._prefix}{order_id}:version"
+
+    async def version(self, order_id: int) -> str:
+        key = self._version_key(order_id)
+        async with self._client.pipeline(transaction=True) as pipe:
+            pipe.set(key, secrets.token_hex(8), nx=True, px=int(self._ttl * 2000))
+            pipe.get(key)
+            _, version = await pipe.execute()
+        return version.decode()
+
+    async def bump(self, order_id: int) -> None:
+        await self._client.set(self._version_key(order_id), secrets.token_hex(8), px=int(self._ttl * 2000))
+
+    async def get(self, order_id: int, version: str) -> Optional[CachedOrder]:
+        order = self._local.get((order_id, version))
+        if order is not MISSING:
+            return order
+        data = await self._client.get(f"{self._prefix}{order_id}:{version}")
+        if data is None:
+            return None
+        order = _decode(data)
+        self._local.set((order_id, version), order)
+        return order
+
+    async def set(self, order_id: int, version: str, order: CachedOrder) -> None:
+        self._local.set((order_id, version), order)
+        await self._client.set(f"{self._prefix}{order_id}:{version}", _encode(order), px=int(self._ttl * 1000))
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class OrderCache:
+    """
+    Read-through cache of serialized orders, keyed by order id and version
+
+    The version is looked up before the database is read and the row is
+    stored under it, so a row read before a concurrent write (which bumps
+    the version) is never served afterwards. Backend failures fall back to
+    the database. Ownership is not checked here: callers check the cached
+    customer_id like they would the row's.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._hits = CACHE_LOOKUPS.labels(cache="orders", result="hit")
+        self._misses = CACHE_LOOKUPS.labels(cache="orders", result="miss")
+
+    def _failed(self, operation: str, order_id: int, exc: Exception) -> None:
+        CACHE_BACKEND_ERRORS.labels(cache="orders", operation=operation).inc()
+        logger.warning("Order cache %s failed for order %s: %s", operation, order_id, exc)
+
+    async def get_or_load(self, order_id: int, loader: Callable[[], Awaitable]) -> Optional[CachedOrder]:
+        """
+        The cached order, or the row `loader` returns (stored for next time);
+        None when the order does not exist
+        """
+        version = None
+        try:
+            version = await self.backend.version(order_id)
+            order = await self.backend.get(order_id, version)
+        except Exception as e:
+            self._failed("read", order_id, e)
+            order = None
+        if order is not None:
+            self._hits.inc()
+            return order
+
+        self._misses.inc()
+        row = await loader()
+        if row is None:
+            return None
+        order = cached_order(row)
+        if version is not None:
+            try:
+                await self.backend.set(order_id, version, order)
+            except Exception as e:
+                self._failed("write", order_id, e)
+        return order
+
+    async def invalidate(self, order_id: int) -> None:
+        try:
+            await self.backend.bump(order_id)
+        except Exception as e:
+            # Other workers may serve the old order until it expires
+            self._failed("invalidate", order_id, e)
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def _build_order_cache() -> Optional[OrderCache]:
+    if not settings.ORDER_CACHE_ENABLED:
+        return None
+    if settings.ORDER_CACHE_BACKEND == "redis":
+        if not settings.ORDER_CACHE_REDIS_URL:
+            raise RuntimeError("ORDER_CACHE_BACKEND=redis requires ORDER_CACHE_REDIS_URL")
+        backend = RedisOrderCacheBackend(
+            settings.ORDER_CACHE_REDIS_URL, settings.ORDER_CACHE_MAX_SIZE, settings.ORDER_CACHE_TTL
+        )
+    else:
+        backend = MemoryOrderCacheBackend(settings.ORDER_CACHE_MAX_SIZE, settings.ORDER_CACHE_TTL)
+    return OrderCache(backend)
+
+
+order_cache = _build_order_cache()
+
+
+def order_database(user_id: int) -> Database:
+    """
+    The database get_order_cached loaders read from: the primary while the
+    cache is on, as a row from a lagging replica would be cached under the
+    order's current version for all of ORDER_CACHE_TTL
+    """
+    return primary if order_cache is not None else read_database(user_id)
+
+
+async def get_order_cached(order_id: int, loader: Callable[[], Awaitable]) -> Optional[CachedOrder]:
+    """
+    Read an order through the cache when it is enabled
+    """
+    if order_cache is None:
+        row = await loader()
+        return None if row is None else cached_order(row)
+    return await order_cache.get_or_load(order_id, loader)
+
+
+async def invalidate_order(order_id: int) -> None:
+    if order_cache is not None:
+        await order_cache.invalidate(order_id)
+
+
+async def close_order_cache() -> None:
+    if order_cache is not None:
+        await order_cache.close()
@@ -1,35 +1,146 @@
+import hashlib
+import time
+from typing import Optional
 import httpx
 from fastapi import HTTPException, status
 from app.core.settings import settings
+from app.exceptions.custom_exceptions import DeadlineExceededException
+from app.middleware.metrics_middleware import (
+    DEADLINE_EXCEEDED,
+    USERS_SERVICE_REQUEST_DURATION,
+    USERS_SERVICE_REQUESTS_IN_FLIGHT,
+)
+from app.utils.deadlines import time_left
+from app.utils.request_timing import record_phase
+from app.utils.ttl_cache import TTLCache
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+user_cache = TTLCache(
+    name="users_service",
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    ttl=settings.USER_CACHE_POSITIVE_TTL,
+)
+
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=settings.USERS_SERVICE_URL,
+        timeout=settings.USERS_SERVICE_TIMEOUT,
+        http2=settings.USERS_SERVICE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=settings.USERS_SERVICE_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.USERS_SERVICE_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.USERS_SERVICE_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+async def start_users_client() -> None:
+    """
+    Create the shared users-service client (called on application startup)
+    """
+    global _client
+    if _client is None:
+        _client = _build_client()
+
+
+async def close_users_client() -> None:
+    """
+    Close the shared users-service client and its pooled connections
+    """
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_users_client() -> httpx.AsyncClient:
+    # Lazily created so scripts that never ran the startup hook still work
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def _token_fingerprint(token: str) -> str:
+    # Never keep raw bearer tokens around as cache keys
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def _verification_ttl(exists: bool) -> float:
+    if exists:
+        return settings.USER_CACHE_POSITIVE_TTL
+    return settings.USER_CACHE_NEGATIVE_TTL
 
 
 async def verify_user_exists(user_id: int, token: str) -> bool:
     """
     Verify that a user exists in the users-service
+
+    Results are cached per (user_id, token) and concurrent lookups for the
+    same key share a single upstream call. Errors are never cached.
     """
+    start_time = time.perf_counter()
     try:
-        headers = {"Authorization": f"Bearer {token}"}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.USERS_SERVICE_URL}/v1/auth/me",
-                headers=headers,
-                timeout=10.0
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                # Verify the returned user ID matches the token's user ID
-                return str(user_data.get("id")) == str(user_id)
-            elif response.status_code == 404:
-                return False
-            else:
-                raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Users service unavailable"
-                )
-                
+        if not settings.USER_CACHE_ENABLED:
+            return await _fetch_user_exists(user_id, token)
+
+        return await user_cache.get_or_load(
+            (user_id, _token_fingerprint(token)),
+            lambda: _fetch_user_exists(user_id, token),
+            ttl_for=_verification_ttl,
+            # The loader is limited by its caller's deadline, not ours
+            retry_on=(DeadlineExceededException,),
+        )
+    finally:
+        record_phase("users_service", time.perf_counter() - start_time)
+
+
+async def _fetch_user_exists(user_id: int, token: str) -> bool:
+    client = get_users_client()
+    headers = {"Authorization": f"Bearer {token}"}
+    # Never wait past the request's deadline
+    left = time_left("users_service")
+    timeout = settings.USERS_SERVICE_TIMEOUT if left is None else min(left, settings.USERS_SERVICE_TIMEOUT)
+    start_time = time.perf_counter()
+    try:
+        # Counted here: httpx does not expose its pool's usage
+        with USERS_SERVICE_REQUESTS_IN_FLIGHT.track_inprogress():
+            response = await client.get("/v1/auth/me", headers=headers, timeout=timeout)
+    except httpx.TimeoutException:
+        USERS_SERVICE_REQUEST_DURATION.labels(status="error").observe(
+            time.perf_counter() - start_time
+        )
+        if timeout < settings.USERS_SERVICE_TIMEOUT:
+            DEADLINE_EXCEEDED.labels(stage="users_service").inc()
+            raise DeadlineExceededException()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Failed to connect to users service"
+        )
     except httpx.RequestError:
+        USERS_SERVICE_REQUEST_DURATION.labels(status="error").observe(
+            time.perf_counter() - start_time
+        )
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Failed to connect to users service"
         )
+
+    USERS_SERVICE_REQUEST_DURATION.labels(status=str(response.status_code)).observe(
+        time.perf_counter() - start_time
+    )
+
+    if response.status_code == 200:
+        user_data = response.json()
+        # Verify the returned user ID matches the token's user ID
+        return str(user_data.get("id")) == str(user_id)
+    elif response.status_code == 404:
+        return False
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Users service unavailable"
+        )
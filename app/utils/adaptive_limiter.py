@@ -0,0 +1,103 @@
+import asyncio
+import time
+from collections import deque
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit with a bounded FIFO wait queue, adapted to observed
+    latency with AIMD: while requests finish within `target` seconds and the
+    limit is in use, it grows by 1/limit per request (about +1 per full
+    window); when one is slower or fails, it is multiplied by
+    `decrease_factor`, at most once per `target` seconds so that a single
+    slow burst does not collapse it.
+
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float,
+        maximum: float,
+        target: float,
+        queue_size: int,
+        queue_timeout: float,
+        decrease_factor: float = 0.9,
+    ):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.target = target
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    async def acquire(self) -> str:
+        """
+        Take a slot, waiting in the queue if needed
+
+        Returns "admitted", or the reason it was not: "queue_full" (rejected
+        immediately) or "timeout" (waited queue_timeout without a slot).
+        """
+        if self._has_capacity() and not self._waiters:
+            self.in_flight += 1
+            return "admitted"
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            return "admitted"
+        except asyncio.TimeoutError:
+            if self._handed_over(waiter):
+                return "admitted"
+            return "timeout"
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot handed to us
+            if self._handed_over(waiter):
+                self.release(0.0, ok=True, adapt=False)
+            raise
+
+    def _handed_over(self, waiter: asyncio.Future) -> bool:
+        if waiter.done():
+            return True
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return False
+
+    def release(self, latency: float, ok: bool, adapt: bool = True) -> None:
+        """
+        Give back a slot, adapting the limit to how the request went
+        """
+        saturated = self.in_flight * 2 >= self.limit
+        self.in_flight -= 1
+        if adapt:
+            if not ok or latency > self.target:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.target:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._last_decrease = now
+            elif saturated:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        # Slots are handed over directly, so newcomers cannot jump the queue
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+from app.core.settings import settings
+from app.exceptions.custom_exceptions import DeadlineExceededException
+from app.middleware.metrics_middleware import DEADLINE_EXCEEDED
+
+
+# time.monotonic() by which the request being handled must be done; set by
+# DeadlineMiddleware, None when the request has no deadline
+current_deadline: ContextVar[Optional[float]] = ContextVar(
+    "current_deadline", default=None
+)
+
+# SQLSTATE query_canceled, raised by Postgres when statement_timeout fires
+QUERY_CANCELED = "57014"
+
+
+def time_left(stage: str) -> Optional[float]:
+    """
+    Seconds left before the current request's deadline, None without one
+
+    Raises DeadlineExceededException (504), counted under `stage`, when
+    the deadline has already passed, so no new work is started for it.
+    """
+    deadline = current_deadline.get()
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        DEADLINE_EXCEEDED.labels(stage=stage).inc()
+        raise DeadlineExceededException()
+    return left
+
+
+@asynccontextmanager
+async def statement_deadline() -> AsyncIterator[None]:
+    """
+    Cancel the awaited database call when the request's deadline passes,
+    as asyncpg's own per-call timeout does (asyncpg also cancels the
+    statement on the server), failing the request with
+    DeadlineExceededException
+    """
+    timeout = asyncio.timeout(time_left("database"))
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if not timeout.expired():
+            raise
+        DEADLINE_EXCEEDED.labels(stage="database").inc()
+        raise DeadlineExceededException()
+
+
+def apply_statement_timeout(session, transaction, connection) -> None:
+    """
+    Session after_begin hook for sync sessions, whose statements cannot be
+    cancelled from the event loop: limit the transaction's statements to
+    the time left before the request's deadline once that is below
+    DEADLINE_STATEMENT_TIMEOUT_THRESHOLD, as the SET costs a round trip
+    """
+    left = time_left("database")
+    if left is None or left >= settings.DEADLINE_STATEMENT_TIMEOUT_THRESHOLD:
+        return
+    # SET cannot take bind parameters; the value is always an integer
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(left * 1000))}")
+
+
+def is_statement_timeout(exc: Exception) -> bool:
+    return getattr(getattr(exc, "orig", None), "pgcode", None) == QUERY_CANCELED
@@ -0,0 +1,96 @@
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Optional
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_ENTITY_TAG = re.compile(r'\*|(?:W/)?"[^"]*"')
+# Content codings CompressionMiddleware may append to a strong ETag
+_CODING_SUFFIX = re.compile(r'-(?:gzip|br|zstd)"$')
+
+
+def _micros(moment: datetime) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def order_etag(order_id: int, updated_at: datetime) -> str:
+    """
+    Strong ETag of one order: its id and updated_at in microseconds, which
+    change together with every representation of the order
+    """
+    return f'"{order_id}-{_micros(updated_at)}"'
+
+
+def orders_list_etag(user_id: int, count: int, last_updated_at: Optional[datetime], id_sum: int) -> str:
+    """
+    Strong ETag of a page of orders, from the number of rows, the newest
+    updated_at and the sum of the ids (which catches a row being swapped
+    for another without any update)
+    """
+    last_updated = _micros(last_updated_at) if last_updated_at is not None else ""
+    digest = hashlib.blake2b(
+        f"{user_id}:{count}:{last_updated}:{id_sum}".encode(), digest_size=12
+    ).hexdigest()
+    return f'"{digest}"'
+
+
+def rows_list_etag(user_id: int, rows: Iterable) -> str:
+    """
+    orders_list_etag computed from already fetched rows
+    """
+    rows = list(rows)
+    return orders_list_etag(
+        user_id,
+        len(rows),
+        max((row.updated_at for row in rows), default=None),
+        sum(row.id for row in rows),
+    )
+
+
+def encoded_etag(etag: str, coding: str) -> str:
+    """
+    The ETag of the `coding` encoded representation: a strong validator
+    must differ between representations of different bytes, so "x" becomes
+    "x-gzip". Weak ETags are the same for every encoding.
+    """
+    if etag.startswith("W/"):
+        return etag
+    return f'{etag[:-1]}-{coding}"'
+
+
+def _entity_tags(header: str) -> list[str]:
+    # Tags of encoded representations are compared to the entity's own
+    return [_CODING_SUFFIX.sub('"', tag) for tag in _ENTITY_TAG.findall(header)]
+
+
+def none_match(header: str, etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches `etag` (weak comparison), i.e.
+    the client's copy is current and 304 can be returned
+    """
+    for tag in _entity_tags(header):
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def expected_versions(header: Optional[str], order_id: int) -> Optional[list[datetime]]:
+    """
+    The updated_at values an If-Match header accepts for the order, for a
+    compare-and-set write; None when there is no precondition (no header, or *)
+
+    Weak tags and tags of other orders never match (strong comparison);
+    tags of any content coding of the order do.
+    """
+    if header is None:
+        return None
+    tags = _entity_tags(header)
+    if "*" in tags:
+        return None
+    versions = []
+    for tag in tags:
+        match = re.fullmatch(r'"(\d+)-(-?\d+)"', tag)
+        if match and int(match.group(1)) == order_id:
+            versions.append(EPOCH + timedelta(microseconds=int(match.group(2))))
+    return versions
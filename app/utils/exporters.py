@@ -0,0 +1,36 @@
+import csv
+import io
+from typing import AsyncIterator, Sequence
+
+import orjson
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def ndjson_chunks(partitions: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    """
+    Encode each batch of rows as newline-delimited JSON objects
+    """
+    async for rows in partitions:
+        yield b"".join(orjson.dumps(dict(row._mapping)) + b"\n" for row in rows)
+
+
+async def csv_chunks(partitions: AsyncIterator[list], columns: Sequence[str]) -> AsyncIterator[str]:
+    """
+    Encode each batch of rows as CSV, preceded by a header line
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for rows in partitions:
+        writer.writerows(row.tuple() for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Header only: the export was empty
+        yield buffer.getvalue()
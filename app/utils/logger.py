@@ -1,66 +1,301 @@
+import copy
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from typing import Any, Dict
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 from pathlib import Path
 
+import orjson
+
+from app.middleware.metrics_middleware import LOG_RECORDS_DROPPED
+
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_ATTRIBUTES = frozenset(
+    vars(logging.LogRecord("", 0, "", 0, "", (), None))
+) | {"message", "asctime", "taskName"}
+
+_listeners: list["BatchingQueueListener"] = []
+# Names of the loggers setup_logger has configured in this process
+_configured: set[str] = set()
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per line, including any fields passed via `extra=`
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode()
+
+
+class DropCountingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hand records to the background listener without ever blocking the
+    caller; when the queue is full the record is dropped and counted
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Only merge the arguments into the message, as they may change once
+        the caller moves on; formatting, tracebacks included, is left to
+        the listener's handlers (the base class formats everything here)
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+
+class BatchedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    Size-rotated file handler that does not flush after every record;
+    the listener flushes once per batch so a batch costs a single write
+
+    The size of the file is tracked as lines are written (in characters,
+    bytes for ASCII), rather than formatting each record twice and seeking
+    to the end of the file as the base class does to decide on rollover.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._size = self._file_size()
+
+    def _file_size(self) -> int:
+        try:
+            return os.path.getsize(self.baseFilename)
+        except OSError:
+            return 0
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        # Without backups the file is reopened as it was
+        self._size = self._file_size()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record) + self.terminator
+            if self.maxBytes > 0 and self._size and self._size + len(line) >= self.maxBytes:
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(line)
+            self._size += len(line)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingQueueListener:
+    """
+    Background thread draining the log queue in batches into the real
+    handlers, so console and disk I/O never happen on the event loop
+    """
+
+    _sentinel = None
+
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        handlers: list[logging.Handler],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+    ):
+        self.queue = log_queue
+        self.handlers = handlers
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        # Blocking put: the sentinel must get through even if the queue is full
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def _handle(self, batch: list[logging.LogRecord]) -> None:
+        for handler in self.handlers:
+            for record in batch:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            handler.flush()
+
+    def _run(self) -> None:
+        while True:
+            batch = []
+            try:
+                record = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            stopping = record is self._sentinel
+            if not stopping:
+                batch.append(record)
+            # Take whatever else is already waiting, up to a full batch
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is self._sentinel:
+                    stopping = True
+                else:
+                    batch.append(record)
+            if batch:
+                self._handle(batch)
+            if stopping:
+                for handler in self.handlers:
+                    handler.close()
+                return
+
+
+def per_process_log_file(log_file: str) -> str:
+    """
+    The log file of this process: logs/app.log becomes logs/app.<pid>.log
+
+    Rotation renames the file, which is only safe with a single writer, so
+    workers sharing a log directory each write (and rotate) their own file.
+    """
+    path = Path(log_file)
+    return str(path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}"))
+
 
 def setup_logger(
     name: str = "fastapi-users-service",
     log_level: str = "INFO",
-    log_file: str = None
+    log_file: str = None,
+    json_format: bool = False,
+    queue_size: int = 0,
+    batch_size: int = 100,
+    flush_interval: float = 1.0,
+    max_bytes: int = 0,
+    backup_count: int = 0,
 ) -> logging.Logger:
     """
     Setup logger with console and file handlers
-    
+
     Args:
         name: Logger name
         log_level: Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
         log_file: Optional log file path
-    
+        json_format: Emit one JSON object per line instead of plain text
+        queue_size: When > 0, records are queued (up to this many) and
+            written by a background thread; excess records are dropped
+        batch_size: Records written per batch by the background thread
+        flush_interval: Longest time a queued record waits to be written
+        max_bytes: Rotate the log file at this size (0 never rotates)
+        backup_count: Rotated log files to keep
+
     Returns:
         Configured logger instance
+
+    Calling it again for the same logger returns it as it is: main.py runs
+    once as __main__ and once more when uvicorn imports it, and a second
+    setup would start another writer thread.
     """
     # Create logger
     logger = logging.getLogger(name)
+    if name in _configured:
+        return logger
+    _configured.add(name)
     logger.setLevel(getattr(logging, log_level.upper()))
-    
+
     # Clear existing handlers
     logger.handlers.clear()
-    
+
     # Create formatter
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
+    if json_format:
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
+    handlers = []
+
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(getattr(logging, log_level.upper()))
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
+    handlers.append(console_handler)
+
     # File handler (if specified)
     if log_file:
         # Create log directory if it doesn't exist
         log_path = Path(log_file)
         log_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        file_handler = logging.FileHandler(log_file)
+
+        if queue_size > 0:
+            file_handler = BatchedRotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count
+            )
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count
+            )
         file_handler.setLevel(getattr(logging, log_level.upper()))
         file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    
+        handlers.append(file_handler)
+
+    if queue_size > 0:
+        log_queue = queue.Queue(maxsize=queue_size)
+        listener = BatchingQueueListener(
+            log_queue, handlers, batch_size=batch_size, flush_interval=flush_interval
+        )
+        listener.start()
+        _listeners.append(listener)
+        logger.addHandler(DropCountingQueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
+
     return logger
 
 
+def shutdown_logging() -> None:
+    """
+    Write out everything still queued and stop the background writers
+    """
+    while _listeners:
+        _listeners.pop().stop()
+    _configured.clear()
+
+
 def get_logger(name: str = "fastapi-users-service") -> logging.Logger:
     """
     Get logger instance
-    
+
     Args:
         name: Logger name
-    
+
     Returns:
         Logger instance
     """
-    return logging.getLogger(name) 
\ No newline at end of file
+    return logging.getLogger(name)
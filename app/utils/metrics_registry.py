@@ -0,0 +1,88 @@
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+from prometheus_client import REGISTRY, CollectorRegistry, multiprocess
+import psutil
+from app.utils.os_metrics import ProcessResourceCollector
+
+
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+# Built once per process: main.py runs twice in a worker (as __main__ or
+# __mp_main__, then as the "main:app" uvicorn imports), and registering
+# the resource collector twice fails on its duplicated series
+_registry: Optional[CollectorRegistry] = None
+
+
+def multiprocess_enabled() -> bool:
+    """
+    prometheus_client switches every metric to file-backed values when this
+    variable is set before it is imported, so it is the single source of truth
+    """
+    return MULTIPROC_DIR_ENV in os.environ
+
+
+def prepare_multiprocess_dir(path: str) -> None:
+    """
+    Start from an empty metrics directory and point the workers at it
+
+    Must run in the launching process, before any worker is started.
+    """
+    shutil.rmtree(path, ignore_errors=True)
+    Path(path).mkdir(parents=True)
+    os.environ[MULTIPROC_DIR_ENV] = path
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Registry to expose on /metrics: the process's own registry, or one that
+    aggregates the files of all workers in multiprocess mode. Either way it
+    also reports the resource usage of every process serving the app.
+    """
+    global _registry
+    if _registry is not None:
+        return _registry
+    if not multiprocess_enabled():
+        REGISTRY.register(ProcessResourceCollector())
+        _registry = REGISTRY
+    else:
+        _registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(_registry)
+        _registry.register(ProcessResourceCollector(worker_pids))
+    return _registry
+
+
+def _file_pids() -> set[int]:
+    # Metric files are named <type>_<pid>.db
+    pids = set()
+    for file in Path(os.environ[MULTIPROC_DIR_ENV]).glob("*.db"):
+        pid = file.stem.rsplit("_", 1)[-1]
+        if pid.isdigit():
+            pids.add(int(pid))
+    return pids
+
+
+def worker_pids() -> list[int]:
+    """
+    Workers that have written metrics and are still running
+    """
+    return [pid for pid in _file_pids() if psutil.pid_exists(pid)]
+
+
+def mark_dead_workers() -> None:
+    """
+    Drop the live gauge files of workers that are gone (e.g. crashed and
+    were replaced), so their last values stop counting towards the total.
+    Counter and histogram files are kept, so totals never go backwards.
+    """
+    for pid in _file_pids():
+        if not psutil.pid_exists(pid):
+            multiprocess.mark_process_dead(pid)
+
+
+def mark_worker_dead() -> None:
+    """
+    Called by a worker on graceful shutdown
+    """
+    multiprocess.mark_process_dead(os.getpid())
@@ -1,20 +1,118 @@
-from prometheus_client import Gauge, REGISTRY
+import asyncio
+import gc
+import os
+import time
+from typing import Callable, Iterable
+from prometheus_client.metrics_core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
 import psutil
 
+from app.core.settings import settings
+from app.middleware.metrics_middleware import EVENT_LOOP_LAG, GC_PAUSE_DURATION
+from app.utils.logger import get_logger
 
-def register_metric(name, description):
-    try:
-        return Gauge(name, description, registry=REGISTRY)
-    except ValueError:
-        return REGISTRY._names_to_collectors[name]
 
+logger = get_logger(f"{settings.LOGGER_NAME}.runtime")
 
-CPU_USAGE = register_metric("process_cpu_percent", "CPU usage percent")
-MEMORY_USAGE = register_metric("process_memory_bytes", "Memory usage in bytes")
-THREAD_COUNT = register_metric("process_thread_count", "Thread count")
 
+def own_pid() -> list[int]:
+    return [os.getpid()]
 
-def update_system_metrics():
-    CPU_USAGE.set(psutil.cpu_percent(interval=None))
-    MEMORY_USAGE.set(psutil.virtual_memory().used)
-    THREAD_COUNT.set(psutil.cpu_count() or 0)
+
+class ProcessResourceCollector(Collector):
+    """
+    Per-process resource usage, read from psutil when /metrics is scraped
+    rather than on a timer, so the numbers are current and no work happens
+    on the event loop between scrapes
+
+    `pids` returns the processes to report (this one, or every worker in
+    multiprocess mode); each series is labelled with its pid.
+    """
+
+    def __init__(self, pids: Callable[[], Iterable[int]] = own_pid):
+        self.pids = pids
+        # Kept between scrapes: cpu_percent() measures since the previous call
+        self._processes: dict[int, psutil.Process] = {}
+
+    def _process(self, pid: int) -> psutil.Process:
+        process = self._processes.get(pid)
+        if process is None:
+            process = self._processes[pid] = psutil.Process(pid)
+            process.cpu_percent(interval=None)
+        return process
+
+    def collect(self):
+        memory = GaugeMetricFamily(
+            "process_memory_bytes", "Resident memory (RSS) of the process in bytes", labels=["pid"]
+        )
+        cpu_percent = GaugeMetricFamily(
+            "process_cpu_percent", "Process CPU usage since the previous scrape, in percent of one core", labels=["pid"]
+        )
+        cpu_time = CounterMetricFamily(
+            "process_cpu_time_seconds", "CPU time used by the process by mode", labels=["pid", "mode"]
+        )
+        threads = GaugeMetricFamily(
+            "process_thread_count", "Threads of the process", labels=["pid"]
+        )
+        open_fds = GaugeMetricFamily(
+            "process_open_file_descriptors", "Open file descriptors of the process", labels=["pid"]
+        )
+
+        pids = set(self.pids())
+        for pid in list(self._processes):
+            if pid not in pids:
+                del self._processes[pid]
+
+        for pid in sorted(pids):
+            label = str(pid)
+            try:
+                process = self._process(pid)
+                with process.oneshot():
+                    memory.add_metric([label], process.memory_info().rss)
+                    cpu_percent.add_metric([label], process.cpu_percent(interval=None))
+                    times = process.cpu_times()
+                    cpu_time.add_metric([label, "user"], times.user)
+                    cpu_time.add_metric([label, "system"], times.system)
+                    threads.add_metric([label], process.num_threads())
+                    if hasattr(process, "num_fds"):  # not available on Windows
+                        open_fds.add_metric([label], process.num_fds())
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                self._processes.pop(pid, None)
+
+        yield from (memory, cpu_percent, cpu_time, threads, open_fds)
+
+
+_gc_started = 0.0
+
+
+def _time_gc(phase: str, info: dict) -> None:
+    global _gc_started
+    if phase == "start":
+        _gc_started = time.perf_counter()
+    else:
+        GC_PAUSE_DURATION.labels(generation=str(info["generation"])).observe(
+            time.perf_counter() - _gc_started
+        )
+
+
+def install_gc_timer() -> None:
+    """
+    Time every garbage collection pause, by generation
+    """
+    if _time_gc not in gc.callbacks:
+        gc.callbacks.append(_time_gc)
+
+
+async def monitor_event_loop_lag(interval: float, warn_after: float) -> None:
+    """
+    Sleep for `interval` over and over and record how much later than asked
+    the loop woke us up: anything blocking the loop shows up as lag
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start_time = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - start_time - interval, 0.0)
+        EVENT_LOOP_LAG.observe(lag)
+        if lag >= warn_after:
+            logger.warning("Event loop was blocked for %.3fs", lag, extra={"lag": lag})
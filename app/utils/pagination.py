@@ -0,0 +1,27 @@
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, status
+
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    """
+    Build an opaque cursor pointing just after the given (created_at, id)
+    """
+    raw = json.dumps([created_at.isoformat(), order_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Reverse encode_cursor, rejecting anything that was not produced by it
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, order_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
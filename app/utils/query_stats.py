@@ -0,0 +1,111 @@
+import re
+import threading
+from typing import Optional
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+# psycopg2 (pyformat), asyncpg ($n) and sqlite (qmark) bound parameters
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_NUMBER = re.compile(r"(?<![\w$.])-?\d+(?:\.\d+)?\b")
+_WHITESPACE = re.compile(r"\s+")
+# Lists of parameters, optionally cast (asyncpg renders ?::INTEGER)
+_VALUE_LIST = re.compile(r"\(\?(?:::\w+)?(?:, \?(?:::\w+)?)+\)")
+_REPEATED_LIST = re.compile(r"(\(\?, \.\.\.\))(?:, \1)+")
+
+_fingerprints: dict[str, str] = {}
+_FINGERPRINT_CACHE_SIZE = 2048
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalize a statement so every execution of the same query maps to the
+    same text: literals and bound parameters become ?, IN lists and
+    multi-row VALUES collapse, whitespace is squashed
+    """
+    cached = _fingerprints.get(statement)
+    if cached is not None:
+        return cached
+
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _WHITESPACE.sub(" ", normalized).strip()
+    normalized = _VALUE_LIST.sub("(?, ...)", normalized)
+    normalized = _REPEATED_LIST.sub(r"\1, ...", normalized)
+
+    if len(_fingerprints) >= _FINGERPRINT_CACHE_SIZE:
+        _fingerprints.clear()
+    _fingerprints[statement] = normalized
+    return normalized
+
+
+class QueryStat:
+    __slots__ = ("calls", "total", "max", "rows")
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+
+
+class QueryStats:
+    """
+    Per-fingerprint call count, time and rows for this process
+
+    Holds at most `max_size` fingerprints; when a new one arrives at the
+    limit, the one with the least total time is dropped.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._stats: dict[str, QueryStat] = {}
+        # Sync sessions run statements on threadpool threads
+        self._lock = threading.Lock()
+
+    def record(self, query: str, seconds: float, rows: int) -> None:
+        with self._lock:
+            stat = self._stats.get(query)
+            if stat is None:
+                if len(self._stats) >= self.max_size:
+                    cheapest = min(self._stats, key=lambda key: self._stats[key].total)
+                    del self._stats[cheapest]
+                stat = self._stats[query] = QueryStat()
+            stat.calls += 1
+            stat.total += seconds
+            stat.rows += rows
+            if seconds > stat.max:
+                stat.max = seconds
+
+    def top(self, limit: int, sort: str = "total") -> list[dict]:
+        with self._lock:
+            entries = [
+                {
+                    "fingerprint": query,
+                    "calls": stat.calls,
+                    "total": stat.total,
+                    "mean": stat.total / stat.calls,
+                    "max": stat.max,
+                    "rows": stat.rows,
+                }
+                for query, stat in self._stats.items()
+            ]
+        entries.sort(key=lambda entry: entry[sort], reverse=True)
+        return entries[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+def repeated_queries(counts: dict[str, int], threshold: int) -> Optional[tuple[str, int]]:
+    """
+    The statement fingerprint run most often in one request, if it was run
+    at least `threshold` times (the usual shape of an N+1 query pattern)
+    """
+    if not counts:
+        return None
+    query, count = max(counts.items(), key=lambda item: item[1])
+    if count < threshold:
+        return None
+    return query, count
@@ -0,0 +1,140 @@
+import math
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional: only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+
+class RateLimitDecision(NamedTuple):
+    allowed: bool
+    # Bucket size (requests that may be made in a burst)
+    limit: int
+    remaining: int
+    # Seconds until the bucket is full again
+    reset_after: float
+    # Seconds until the request would be allowed (0 when it was)
+    retry_after: float
+    # Seconds in which an empty bucket refills completely
+    window: float
+
+
+def decide(tokens: float, rate: float, burst: float, cost: float) -> tuple[float, RateLimitDecision]:
+    """
+    Take `cost` tokens from a bucket holding `tokens` (already refilled),
+    returning the bucket's new token count and the decision
+
+    A cost above the burst only needs a full bucket and leaves it in debt
+    (below zero), which the refill pays off before anything else is allowed.
+    """
+    needed = min(cost, burst)
+    allowed = tokens >= needed
+    if allowed:
+        tokens -= cost
+    return tokens, RateLimitDecision(
+        allowed=allowed,
+        limit=int(burst),
+        remaining=max(int(tokens), 0),
+        reset_after=(burst - tokens) / rate,
+        retry_after=0.0 if allowed else (needed - tokens) / rate,
+        window=burst / rate,
+    )
+
+
+class MemoryTokenBucketStore:
+    """
+    Token buckets held in this process, in `shards` LRU-ordered dicts of at
+    most max_keys / shards buckets each
+
+    Every operation is O(1): a bucket is looked up by key, and at most a
+    couple of the least recently used buckets are checked per call and
+    dropped once they have refilled completely (a full bucket is the same
+    as no bucket). At the size limit the least recently used bucket goes.
+    """
+
+    def __init__(self, shards: int, max_keys: int):
+        # key -> (tokens, updated at, full again at); monotonic times
+        self._shards: list[OrderedDict] = [OrderedDict() for _ in range(shards)]
+        self._max_per_shard = max(1, max_keys // shards)
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> RateLimitDecision:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+
+        bucket = shard.get(key)
+        if bucket is None:
+            tokens = burst
+            if len(shard) >= self._max_per_shard:
+                shard.popitem(last=False)
+        else:
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            shard.move_to_end(key)
+
+        tokens, decision = decide(tokens, rate, burst, cost)
+        shard[key] = (tokens, now, now + decision.reset_after)
+        self._expire(shard, now)
+        return decision
+
+    @staticmethod
+    def _expire(shard: OrderedDict, now: float, checks: int = 2) -> None:
+        for _ in range(checks):
+            key = next(iter(shard), None)
+            if key is None or shard[key][2] > now:
+                return
+            del shard[key]
+
+    async def close(self) -> None:
+        pass
+
+
+# Refill and take atomically inside Redis; the time comes from the Redis
+# server so workers with skewed clocks still agree
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or burst
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local refilled = tokens
+if tokens >= math.min(cost, burst) then
+    tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(refilled)
+"""
+
+
+class RedisTokenBucketStore:
+    """
+    Token buckets shared by every worker (and replica) through Redis, for
+    multi-worker deployments where per-process buckets would multiply the
+    limit. Keys expire on their own once the bucket has refilled.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self._client = redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+        self._prefix = prefix
+
+    async def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> RateLimitDecision:
+        # The script returns the refilled token count from before it took
+        # the cost, which decide() turns into the same decision it made
+        refilled = float(await self._take(keys=[self._prefix + key], args=[rate, burst, cost]))
+        return decide(refilled, rate, burst, cost)[1]
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def retry_seconds(seconds: float) -> int:
+    return max(1, math.ceil(seconds))
@@ -0,0 +1,82 @@
+import functools
+import inspect
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+from fastapi.routing import APIRoute
+
+
+class RequestTimings:
+    """
+    Time spent per phase (auth, users_service, db_checkout, db, render)
+    during one request, in seconds, and how often each statement
+    fingerprint was executed
+    """
+
+    __slots__ = ("phases", "counts", "statements", "endpoint_done")
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self.counts: dict[str, int] = {}
+        self.statements: dict[str, int] = {}
+        # perf_counter() when the endpoint function returned, if it did
+        self.endpoint_done: Optional[float] = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+
+
+# Set by TimingMiddleware; stays None (and recording is a no-op) when it is disabled
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "current_timings", default=None
+)
+
+
+def record_phase(phase: str, seconds: float) -> None:
+    """
+    Add `seconds` to `phase` of the request being handled, if timing is on
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(phase, seconds)
+
+
+def record_statement(query: str) -> None:
+    """
+    Count one execution of the statement fingerprint `query` for the request
+    being handled, if timing is on
+    """
+    timings = current_timings.get()
+    if timings is not None:
+        timings.statements[query] = timings.statements.get(query, 0) + 1
+
+
+def timed_endpoint(endpoint: Callable) -> Callable:
+    """
+    Mark when the endpoint function returns, so the time from there to the
+    response start (response_model validation and JSON rendering) can be
+    reported as its own phase
+    """
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = current_timings.get()
+            if timings is not None:
+                timings.endpoint_done = time.perf_counter()
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """
+    APIRoute whose (async) endpoint reports when it finished
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = timed_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
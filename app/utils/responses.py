@@ -0,0 +1,53 @@
+from typing import Iterable, Sequence
+
+import orjson
+from fastapi.responses import Response
+
+from app.schemas.order import OrderRead
+
+
+# Field names in the order OrderRead declares them; rows selected in the same
+# column order can be zipped straight into its JSON shape
+ORDER_READ_FIELDS = tuple(OrderRead.model_fields)
+
+
+def orders_json(rows: Iterable[Sequence]) -> bytes:
+    """
+    Serialize rows (in ORDER_READ_FIELDS column order) as a JSON list of
+    OrderRead objects without validating each one into a pydantic model
+
+    The rows come straight from the orders table, whose column types already
+    match OrderRead, so the output is the same as FastAPI's response_model
+    serialization (UTC datetimes end in Z, as pydantic writes them).
+    """
+    return orjson.dumps(
+        [dict(zip(ORDER_READ_FIELDS, row)) for row in rows],
+        option=orjson.OPT_UTC_Z,
+    )
+
+
+def order_json(row: Sequence) -> bytes:
+    """
+    Serialize one row (in ORDER_READ_FIELDS column order) as an OrderRead
+    object, like orders_json
+    """
+    return orjson.dumps(dict(zip(ORDER_READ_FIELDS, row)), option=orjson.OPT_UTC_Z)
+
+
+class OrderResponse(Response):
+    """
+    Already-serialized order (see order_json)
+    """
+
+    media_type = "application/json"
+
+
+class OrderListResponse(Response):
+    """
+    Already-serialized list of orders (see orders_json)
+
+    Returning a Response makes FastAPI skip response_model validation; the
+    route keeps its response_model for the OpenAPI schema.
+    """
+
+    media_type = "application/json"
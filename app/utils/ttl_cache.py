@@ -0,0 +1,120 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from app.middleware.metrics_middleware import CACHE_EVICTIONS, CACHE_LOOKUPS
+
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU cache with per-entry expiry.
+
+    Concurrent misses for the same key are coalesced in get_or_load so
+    only one loader call is in flight per key.
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        # Resolve label children once, these are hit on every lookup
+        self._hits = CACHE_LOOKUPS.labels(cache=name, result="hit")
+        self._misses = CACHE_LOOKUPS.labels(cache=name, result="miss")
+        self._coalesced = CACHE_LOOKUPS.labels(cache=name, result="coalesced")
+        self._expired = CACHE_EVICTIONS.labels(cache=name, reason="expired")
+        self._evicted = CACHE_EVICTIONS.labels(cache=name, reason="size")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Return the cached value or MISSING, without touching the metrics
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._expired.inc()
+            return MISSING
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self._evicted.inc()
+
+    def delete(self, key: Hashable) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def get_or_load(
+        self,
+        key: Hashable,
+        loader: Callable[[], Awaitable[Any]],
+        ttl_for: Optional[Callable[[Any], float]] = None,
+        retry_on: tuple[type[BaseException], ...] = (),
+    ) -> Any:
+        """
+        Return the cached value, loading and storing it on a miss.
+
+        Exceptions raised by the loader are propagated to every waiter and
+        are never cached, except `retry_on` ones: those only concern the
+        caller that ran the loader (e.g. its own deadline), so waiters load
+        the value again themselves.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            self._hits.inc()
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self._coalesced.inc()
+            try:
+                # shield: one waiter being cancelled must not cancel the others
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # The loading caller was cancelled (e.g. its client went
+                # away), not this one: load it ourselves
+                return await self.get_or_load(key, loader, ttl_for, retry_on)
+            except retry_on:
+                return await self.get_or_load(key, loader, ttl_for, retry_on)
+
+        self._misses.inc()
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark retrieved so an unobserved failure does not log a warning
+            future.exception()
+            raise
+        else:
+            self.set(key, value, ttl_for(value) if ttl_for else None)
+            future.set_result(value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
@@ -1,24 +1,54 @@
 import asyncio
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pathlib import Path
 from prometheus_client import REGISTRY, make_asgi_app, Gauge
 import psutil
 
 from app.core.settings import settings
+from app.database import dispose_engines
+from app.dependencies.rate_limit import close_rate_limit_store
+from app.middleware.admission_middleware import AdmissionMiddleware
+from app.middleware.compression_middleware import CompressionMiddleware
+from app.middleware.deadline_middleware import DeadlineMiddleware
 from app.middleware.logging_middleware import LoggingMiddleware
 from app.middleware.metrics_middleware import MetricsMiddleware
+from app.middleware.rate_limit_middleware import RateLimitHeadersMiddleware
 from app.middleware.register_exceptions import RegisterExceptionsMiddleware
+from app.middleware.timing_middleware import TimingMiddleware
+from app.routes.admin import admin_router
 from app.routes.orders import order_router
-from app.utils.logger import setup_logger
-from app.utils.os_metrics import update_system_metrics
+from app.services.idempotency import purge_expired_keys
+from app.services.order_cache import close_order_cache
+from app.services.jwks_service import jwks_cache
+from app.services.user_service import close_users_client, start_users_client
+from app.utils.logger import per_process_log_file, setup_logger, shutdown_logging
+from app.utils.metrics_registry import (
+    mark_dead_workers,
+    mark_worker_dead,
+    metrics_registry,
+    multiprocess_enabled,
+    prepare_multiprocess_dir,
+)
+from app.utils.os_metrics import install_gc_timer, monitor_event_loop_lag
 
 
 logs_dir = Path("logs")
 logs_dir.mkdir(exist_ok=True)
 
 logger = setup_logger(
-    name=settings.LOGGER_NAME, log_level="INFO", log_file=settings.LOGGER_PATH
+    name=settings.LOGGER_NAME,
+    log_level=settings.LOG_LEVEL,
+    # One file per worker when several share the log directory
+    log_file=per_process_log_file(settings.LOGGER_PATH) if multiprocess_enabled() else settings.LOGGER_PATH,
+    json_format=settings.LOG_JSON,
+    queue_size=settings.LOG_QUEUE_SIZE,
+    batch_size=settings.LOG_BATCH_SIZE,
+    flush_interval=settings.LOG_FLUSH_INTERVAL,
+    max_bytes=settings.LOG_MAX_BYTES,
+    backup_count=settings.LOG_BACKUP_COUNT,
 )
 
 app = FastAPI(
@@ -26,6 +56,7 @@ app = FastAPI(
     description="A FastAPI service for managing orders",
     version="1.0.0",
     docs_url="/docs",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -36,21 +67,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 RegisterExceptionsMiddleware(app)
+if settings.RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitHeadersMiddleware)
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware)
+if settings.REQUEST_TIMING_ENABLED:
+    app.add_middleware(TimingMiddleware)
+if settings.ADMISSION_ENABLED:
+    app.add_middleware(AdmissionMiddleware)
+# Outside admission control, so time spent queued counts against the deadline
+if settings.DEADLINE_ENABLED:
+    app.add_middleware(DeadlineMiddleware)
 app.add_middleware(MetricsMiddleware)
 app.add_middleware(LoggingMiddleware)
 
 app.include_router(order_router, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
 
-metrics_app = make_asgi_app()
+metrics_app = make_asgi_app(registry=metrics_registry())
 app.mount("/metrics", metrics_app)
 
 
+async def cancel_background_task(task: asyncio.Task) -> None:
+    """
+    Cancel a background task and wait for it to unwind
+    """
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
 @app.get("/health")
 async def health_check():
     """
     Health check endpoint
     """
-    logger.info("Health check requested")
+    logger.debug("Health check requested")
     return {
         "status": "healthy",
         "service": settings.APP_NAME,
@@ -73,19 +127,121 @@ async def root():
 
 
 @app.on_event("startup")
-async def start_metric_updater():
-    async def run():
-        while True:
-            update_system_metrics()
-            await asyncio.sleep(settings.METRICS_UPDATE_INTERVAL)
+async def start_runtime_monitors():
+    install_gc_timer()
+    # Keep a reference: the loop itself only holds tasks weakly
+    app.state.loop_lag_monitor = asyncio.create_task(
+        monitor_event_loop_lag(
+            settings.EVENT_LOOP_LAG_INTERVAL, settings.EVENT_LOOP_LAG_WARN_SECONDS
+        )
+    )
 
-    asyncio.create_task(run())
 
+@app.on_event("startup")
+async def start_idempotency_key_cleanup():
+    app.state.idempotency_key_cleanup = asyncio.create_task(
+        purge_expired_keys(
+            settings.IDEMPOTENCY_CLEANUP_INTERVAL, settings.IDEMPOTENCY_CLEANUP_BATCH_SIZE
+        )
+    )
 
-if __name__ == "__main__":
+
+@app.on_event("startup")
+async def clean_up_worker_metrics():
+    if multiprocess_enabled():
+        mark_dead_workers()
+
+
+@app.on_event("startup")
+async def open_users_client():
+    await start_users_client()
+
+
+@app.on_event("startup")
+async def start_jwks_refresh():
+    if settings.AUTH_MODE == "local" and jwks_cache is not None:
+        jwks_cache.start()
+
+
+@app.on_event("shutdown")
+async def stop_idempotency_key_cleanup():
+    # Waits for a purge in flight to roll back before the engines are disposed
+    await cancel_background_task(app.state.idempotency_key_cleanup)
+
+
+@app.on_event("shutdown")
+async def stop_runtime_monitors():
+    await cancel_background_task(app.state.loop_lag_monitor)
+
+
+@app.on_event("shutdown")
+async def close_database_connections():
+    await dispose_engines()
+
+
+@app.on_event("shutdown")
+async def shutdown_users_client():
+    await close_users_client()
+
+
+@app.on_event("shutdown")
+async def close_rate_limiter():
+    await close_rate_limit_store()
+
+
+@app.on_event("shutdown")
+async def close_orders_cache():
+    await close_order_cache()
+
+
+@app.on_event("shutdown")
+async def stop_jwks_refresh():
+    if jwks_cache is not None:
+        await jwks_cache.stop()
+
+
+@app.on_event("shutdown")
+async def release_worker_metrics():
+    if multiprocess_enabled():
+        mark_worker_dead()
+
+
+@app.on_event("shutdown")
+async def flush_logs():
+    shutdown_logging()
+
+
+def run_server():
     import uvicorn
 
-    logger.info(f"Starting {settings.APP_NAME}")
+    if settings.SERVER_MODE != "production":
+        uvicorn.run(
+            "main:app",
+            host=settings.SERVER_HOST,
+            port=settings.SERVER_PORT,
+            reload=True,
+            log_level="info",
+        )
+        return
+
+    workers = settings.SERVER_WORKERS or os.cpu_count() or 1
+    if workers > 1:
+        # Workers inherit the variable, so their metrics go to shared files
+        prepare_multiprocess_dir(settings.METRICS_MULTIPROC_DIR)
     uvicorn.run(
-        "main:app", host="0.0.0.0", port=8001, reload=True, log_level="info"
+        "main:app",
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+        # LoggingMiddleware already writes one line per request
+        access_log=False,
+        log_level="info",
     )
+
+
+if __name__ == "__main__":
+    logger.info(f"Starting {settings.APP_NAME} ({settings.SERVER_MODE})")
+    run_server()
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from app.utils.adaptive_limiter import AdaptiveLimiter
+
+
+def make_limiter(**overrides) -> AdaptiveLimiter:
+    options = dict(
+        initial=2, minimum=1, maximum=10, target=0.5, queue_size=2, queue_timeout=1.0, decrease_factor=0.5
+    )
+    return AdaptiveLimiter(**{**options, **overrides})
+
+
+async def fill(limiter: AdaptiveLimiter) -> None:
+    while limiter.in_flight < int(limiter.limit):
+        assert await limiter.acquire() == "admitted"
+
+
+@pytest.mark.asyncio
+async def test_admits_up_to_the_limit_then_queues():
+    limiter = make_limiter()
+    await fill(limiter)
+
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    assert limiter.queued == 1
+    assert not waiter.done()
+    limiter.release(0.1, ok=True)
+    assert await waiter == "admitted"
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_the_queue_is_full():
+    limiter = make_limiter(queue_size=1)
+    await fill(limiter)
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    assert await limiter.acquire() == "queue_full"
+
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_queued_request_times_out():
+    limiter = make_limiter(queue_timeout=0.01)
+    await fill(limiter)
+
+    assert await limiter.acquire() == "timeout"
+    assert limiter.queued == 0
+    assert limiter.in_flight == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_is_served_in_order():
+    limiter = make_limiter(initial=1, queue_size=5)
+    await fill(limiter)
+    admitted = []
+
+    async def queued(name):
+        await limiter.acquire()
+        admitted.append(name)
+
+    tasks = [asyncio.create_task(queued(name)) for name in "abc"]
+    await asyncio.sleep(0)
+    for _ in range(3):
+        limiter.release(0.1, ok=True, adapt=False)
+        await asyncio.sleep(0)
+
+    await asyncio.gather(*tasks)
+    assert admitted == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    limiter = make_limiter(initial=1)
+    await fill(limiter)
+    waiter = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    limiter.release(0.1, ok=True, adapt=False)
+
+    assert limiter.queued == 0
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_limit_grows_while_fast_and_saturated():
+    limiter = make_limiter()
+    await fill(limiter)
+
+    limiter.release(0.1, ok=True)
+
+    assert limiter.limit == pytest.approx(2.5)
+
+
+@pytest.mark.asyncio
+async def test_limit_does_not_grow_while_mostly_idle():
+    limiter = make_limiter(initial=4)
+    await limiter.acquire()
+
+    limiter.release(0.1, ok=True)
+
+    assert limiter.limit == 4
+
+
+@pytest.mark.asyncio
+async def test_limit_decreases_on_slow_or_failed_requests_once_per_target(clock):
+    limiter = make_limiter(initial=8)
+    for _ in range(3):
+        await limiter.acquire()
+
+    limiter.release(1.0, ok=True)
+    assert limiter.limit == 4
+    # Within `target` of the last decrease: unchanged
+    limiter.release(0.1, ok=False)
+    assert limiter.limit == 4
+
+    clock.now += 0.5
+    limiter.release(0.1, ok=False)
+    assert limiter.limit == 2
+
+
+@pytest.mark.asyncio
+async def test_limit_stays_within_bounds(clock):
+    limiter = make_limiter(initial=1, minimum=1, maximum=2)
+
+    await limiter.acquire()
+    limiter.release(5.0, ok=False)
+    assert limiter.limit == 1
+
+    for _ in range(5):
+        await limiter.acquire()
+        limiter.release(0.1, ok=True)
+    assert limiter.limit == 2
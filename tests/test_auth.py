@@ -0,0 +1,193 @@
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.dependencies import auth
+from app.services import jwks_service
+from app.services.jwks_service import JWKSCache
+
+
+def make_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def public_jwk(private_key, kid: str) -> dict:
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    return {**jwk, "kid": kid, "alg": "RS256", "use": "sig"}
+
+
+def write_jwks(path, *jwks: dict) -> None:
+    path.write_text(json.dumps({"keys": list(jwks)}))
+
+
+def make_token(private_key, kid: str = "key-1", **claims) -> str:
+    payload = {"sub": "42", "exp": int(time.time()) + 300, **claims}
+    return jwt.encode(payload, private_key, algorithm="RS256", headers={"kid": kid})
+
+
+async def authenticate(token: str) -> dict:
+    return await auth.get_current_user(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+
+
+@pytest.fixture(scope="module")
+def signing_key():
+    return make_key()
+
+
+@pytest.fixture
+def jwks_file(tmp_path, signing_key):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, public_jwk(signing_key, "key-1"))
+    return path
+
+
+@pytest.fixture
+def jwks_cache(monkeypatch, jwks_file):
+    cache = JWKSCache(str(jwks_file), refresh_interval=300)
+    monkeypatch.setattr(auth.settings, "AUTH_MODE", "local")
+    monkeypatch.setattr(auth.settings, "JWT_ALGORITHMS", ["RS256"])
+    monkeypatch.setattr(auth, "jwks_cache", cache)
+    auth.verified_tokens.clear()
+    yield cache
+    auth.verified_tokens.clear()
+
+
+@pytest.mark.asyncio
+async def test_valid_token_verified_against_jwks_file(jwks_cache, signing_key):
+    token = make_token(signing_key)
+
+    user = await authenticate(token)
+
+    assert user == {"user_id": 42, "token": token, "verified": True}
+
+
+@pytest.mark.asyncio
+async def test_jwks_file_url(jwks_cache, jwks_file, signing_key, monkeypatch):
+    monkeypatch.setattr(auth, "jwks_cache", JWKSCache(jwks_file.as_uri(), refresh_interval=300))
+
+    user = await authenticate(make_token(signing_key))
+
+    assert user["user_id"] == 42
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_rejected(jwks_cache, signing_key):
+    with pytest.raises(HTTPException) as error:
+        await authenticate(make_token(signing_key, kid="unknown"))
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Invalid token: unknown signing key"
+
+
+@pytest.mark.asyncio
+async def test_rotated_key_is_fetched(jwks_cache, jwks_file, signing_key, monkeypatch):
+    await jwks_cache.refresh()
+    rotated = make_key()
+    write_jwks(jwks_file, public_jwk(signing_key, "key-1"), public_jwk(rotated, "key-2"))
+    monkeypatch.setattr(jwks_service, "MIN_REFRESH_INTERVAL", 0.0)
+
+    user = await authenticate(make_token(rotated, kid="key-2"))
+
+    assert user["user_id"] == 42
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_refetch_is_rate_limited(jwks_cache, jwks_file, signing_key):
+    await jwks_cache.refresh()
+    rotated = make_key()
+    write_jwks(jwks_file, public_jwk(signing_key, "key-1"), public_jwk(rotated, "key-2"))
+
+    # Refreshed less than MIN_REFRESH_INTERVAL ago: the new key is not seen yet
+    with pytest.raises(HTTPException) as error:
+        await authenticate(make_token(rotated, kid="key-2"))
+
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_bad_signature_rejected(jwks_cache):
+    # Signed by a key that is not in the JWKS, but claiming its kid
+    token = make_token(make_key(), kid="key-1")
+
+    with pytest.raises(HTTPException) as error:
+        await authenticate(token)
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Invalid token"
+
+
+@pytest.mark.asyncio
+async def test_expired_token_rejected(jwks_cache, signing_key):
+    token = make_token(signing_key, exp=int(time.time()) - 60)
+
+    with pytest.raises(HTTPException) as error:
+        await authenticate(token)
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Token has expired"
+
+
+@pytest.mark.asyncio
+async def test_missing_sub_rejected(jwks_cache, signing_key):
+    token = jwt.encode(
+        {"exp": int(time.time()) + 300}, signing_key, algorithm="RS256", headers={"kid": "key-1"}
+    )
+
+    with pytest.raises(HTTPException) as error:
+        await authenticate(token)
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Invalid token: missing sub claim"
+
+
+@pytest.mark.asyncio
+async def test_non_integer_sub_rejected(jwks_cache, signing_key):
+    with pytest.raises(HTTPException) as error:
+        await authenticate(make_token(signing_key, sub="alice"))
+
+    assert error.value.status_code == 401
+    assert error.value.detail == "Invalid token"
+
+
+@pytest.mark.asyncio
+async def test_verified_token_is_cached(jwks_cache, signing_key, monkeypatch):
+    token = make_token(signing_key)
+    await authenticate(token)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cached token was verified again")
+
+    monkeypatch.setattr(auth.jwt, "decode", fail)
+    user = await authenticate(token)
+
+    assert user == {"user_id": 42, "token": token, "verified": True}
+
+
+@pytest.mark.asyncio
+async def test_cached_token_expires_with_the_token(jwks_cache, signing_key, clock, monkeypatch):
+    token = make_token(signing_key, exp=int(time.time()) + 60)
+    await authenticate(token)
+
+    clock.now += 60
+    decode = auth.jwt.decode
+    decoded = []
+    monkeypatch.setattr(auth.jwt, "decode", lambda *args, **kwargs: decoded.append(True) or decode(*args, **kwargs))
+    await authenticate(token)
+
+    assert decoded == [True]
+
+
+@pytest.mark.asyncio
+async def test_failed_verification_is_not_cached(jwks_cache, signing_key):
+    token = make_token(signing_key, sub="alice")
+
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await authenticate(token)
+
+    assert len(auth.verified_tokens) == 0
@@ -0,0 +1,175 @@
+import gzip
+import zlib
+from typing import Optional
+
+import pytest
+
+from app.middleware import compression_middleware
+from app.middleware.compression_middleware import CompressionMiddleware, GzipEncoder, choose_encoding
+
+
+BIG_JSON = b'{"orders": [' + b",".join(b'{"id": %d}' % index for index in range(500)) + b"]}"
+
+
+@pytest.fixture
+def encodings(monkeypatch):
+    # Independent of which optional encoders are installed
+    monkeypatch.setattr(compression_middleware.settings, "COMPRESSION_ENCODINGS", ["br", "gzip"])
+    monkeypatch.setattr(compression_middleware, "ENCODERS", {"gzip": GzipEncoder, "br": GzipEncoder})
+
+
+def make_scope(accept_encoding: str = "gzip", headers: Optional[dict] = None) -> dict:
+    headers = {"accept-encoding": accept_encoding, **(headers or {})}
+    return {
+        "type": "http",
+        "method": "GET",
+        "path": "/api/v1/orders/1",
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+    }
+
+
+def responding(*bodies: bytes, status: int = 200, headers: Optional[dict] = None):
+    """
+    An application sending `bodies` as the chunks of one response, JSON
+    unless `headers` say otherwise (304s, like the routes' ones, have no
+    Content-Type)
+    """
+    headers = headers or {}
+    if status != 304:
+        headers = {"content-type": "application/json", **headers}
+
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        })
+        for index, body in enumerate(bodies):
+            await send({"type": "http.response.body", "body": body, "more_body": index < len(bodies) - 1})
+
+    return app
+
+
+async def call(app, scope: dict) -> tuple[dict, list[bytes]]:
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await CompressionMiddleware(app)(scope, None, send)
+    headers = {name.decode(): value.decode() for name, value in sent[0]["headers"]}
+    return headers, [message["body"] for message in sent[1:]]
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("gzip, br", "br"),
+        ("gzip;q=1.0, br;q=0.5", "br"),
+        ("br;q=0, gzip", "gzip"),
+        ("GZIP", "gzip"),
+        ("*", "br"),
+        ("*;q=0", None),
+        ("*, br;q=0", "gzip"),
+        ("gzip;q=0", None),
+        ("deflate, identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding_follows_our_preference_among_accepted(encodings, header, expected):
+    assert choose_encoding(header) == expected
+
+
+@pytest.mark.asyncio
+async def test_large_body_is_compressed(encodings):
+    app = responding(BIG_JSON, headers={"content-length": str(len(BIG_JSON))})
+
+    headers, bodies = await call(app, make_scope())
+
+    assert headers["content-encoding"] == "gzip"
+    assert headers["vary"] == "Accept-Encoding"
+    assert headers["content-length"] == str(len(bodies[0]))
+    assert gzip.decompress(bodies[0]) == BIG_JSON
+
+
+@pytest.mark.asyncio
+async def test_body_below_min_size_is_sent_as_is(encodings):
+    body = b'{"id": 1}'
+
+    headers, bodies = await call(responding(body), make_scope())
+
+    assert "content-encoding" not in headers
+    # The response still depends on Accept-Encoding
+    assert headers["vary"] == "Accept-Encoding"
+    assert bodies == [body]
+
+
+@pytest.mark.asyncio
+async def test_streamed_chunks_are_flushed_as_they_come(encodings):
+    chunks = [b'{"id": 1}\n', b'{"id": 2}\n', b'{"id": 3}\n']
+
+    headers, bodies = await call(responding(*chunks), make_scope())
+
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    decompressor = zlib.decompressobj(31)
+    # Each chunk decodes on arrival, without waiting for the end of the stream
+    assert [decompressor.decompress(body) for body in bodies] == chunks
+
+
+@pytest.mark.asyncio
+async def test_uncompressed_without_an_accepted_encoding(encodings):
+    headers, bodies = await call(responding(BIG_JSON), make_scope(accept_encoding="identity"))
+
+    assert "content-encoding" not in headers
+    assert "vary" not in headers
+    assert bodies == [BIG_JSON]
+
+
+@pytest.mark.asyncio
+async def test_already_encoded_response_is_left_alone(encodings):
+    encoded = gzip.compress(BIG_JSON)
+    app = responding(encoded, headers={"content-encoding": "gzip"})
+
+    headers, bodies = await call(app, make_scope(accept_encoding="br"))
+
+    assert headers["content-encoding"] == "gzip"
+    assert bodies == [encoded]
+
+
+@pytest.mark.asyncio
+async def test_incompressible_type_is_left_alone(encodings):
+    app = responding(BIG_JSON, headers={"content-type": "image/png"})
+
+    headers, bodies = await call(app, make_scope())
+
+    assert "content-encoding" not in headers
+    assert bodies == [BIG_JSON]
+
+
+@pytest.mark.asyncio
+async def test_strong_etag_names_the_coding(encodings):
+    app = responding(BIG_JSON, headers={"etag": '"7-100"'})
+
+    headers, _ = await call(app, make_scope())
+
+    assert headers["etag"] == '"7-100-gzip"'
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body, etag", [(BIG_JSON, 'W/"7-100"'), (b'{"id": 7}', '"7-100"')])
+async def test_etag_kept_when_weak_or_uncompressed(encodings, body, etag):
+    headers, _ = await call(responding(body, headers={"etag": etag}), make_scope())
+
+    assert headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("if_none_match, etag", [('"7-100-gzip"', '"7-100-gzip"'), ('"7-100"', '"7-100"')])
+async def test_not_modified_carries_the_etag_the_client_holds(encodings, if_none_match, etag):
+    app = responding(b"", status=304, headers={"etag": '"7-100"'})
+
+    headers, _ = await call(app, make_scope(headers={"if-none-match": if_none_match}))
+
+    assert headers["etag"] == etag
+    assert headers["vary"] == "Accept-Encoding"
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from app import database
+from app.database import execute, session_scope
+
+
+class BlockingSession:
+    """
+    Sync session whose statements run until released
+    """
+
+    def __init__(self):
+        self.info = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.running = False
+        self.closed_while_running = None
+
+    def execute(self, statement, params=None):
+        self.running = True
+        self.started.set()
+        self.release.wait(5)
+        self.running = False
+
+    def close(self):
+        self.closed_while_running = self.running
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setattr(database.settings, "DATABASE_ASYNC", False)
+    return BlockingSession()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_statement_finishes_before_the_session_closes(session):
+    async def request():
+        async with session_scope(SimpleNamespace(sessionmaker=lambda: session)) as db:
+            await execute(db, "SELECT pg_sleep(10)")
+
+    task = asyncio.create_task(request())
+    await asyncio.to_thread(session.started.wait, 5)
+    task.cancel()
+    await asyncio.sleep(0.05)
+
+    # Still running in its thread: the session is left alone
+    assert session.closed_while_running is None
+    session.release.set()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert session.closed_while_running is False
+
+
+@pytest.mark.asyncio
+async def test_session_closes_right_away_without_a_running_statement(session):
+    session.release.set()
+
+    async with session_scope(SimpleNamespace(sessionmaker=lambda: session)) as db:
+        await execute(db, "SELECT 1")
+
+    assert session.closed_while_running is False
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import Optional
+
+import pytest
+
+from app.middleware.deadline_middleware import CLIENT_CLOSED_REQUEST, DeadlineMiddleware
+from app.utils.deadlines import current_deadline
+
+
+EMPTY_BODY = {"type": "http.request", "body": b"", "more_body": False}
+DISCONNECT = {"type": "http.disconnect"}
+
+
+def make_scope(method: str = "GET", path: str = "/api/v1/orders/1", headers: Optional[dict] = None) -> dict:
+    headers = headers or {}
+    return {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+    }
+
+
+class Client:
+    """
+    The server side of one request: messages the client sends are queued
+    for receive(), what the application sends is kept in `sent`
+    """
+
+    def __init__(self, *messages: dict):
+        self.messages: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            self.messages.put_nowait(message)
+        self.sent: list[dict] = []
+
+    async def receive(self) -> dict:
+        return await self.messages.get()
+
+    async def send(self, message: dict) -> None:
+        self.sent.append(message)
+
+    @property
+    def status(self) -> int:
+        return next(message["status"] for message in self.sent if message["type"] == "http.response.start")
+
+
+async def respond(send, body: bytes = b"ok") -> None:
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": body})
+
+
+class HangingApp:
+    """
+    Never responds; records whether it was cancelled
+    """
+
+    def __init__(self):
+        self.started = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self, scope, receive, send):
+        self.started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_the_request():
+    app = HangingApp()
+    client = Client(EMPTY_BODY)
+
+    request = asyncio.create_task(DeadlineMiddleware(app)(make_scope(), client.receive, client.send))
+    await app.started.wait()
+    client.messages.put_nowait(DISCONNECT)
+    await request
+
+    assert app.cancelled
+    assert client.status == CLIENT_CLOSED_REQUEST
+
+
+@pytest.mark.asyncio
+async def test_deadline_expiry_cancels_the_request_with_504():
+    app = HangingApp()
+    client = Client(EMPTY_BODY)
+    scope = make_scope(headers={"X-Request-Timeout": "0.01"})
+
+    await asyncio.wait_for(DeadlineMiddleware(app)(scope, client.receive, client.send), timeout=1.0)
+
+    assert app.cancelled
+    assert client.status == 504
+
+
+@pytest.mark.asyncio
+async def test_response_sent_before_the_deadline_is_kept():
+    async def app(scope, receive, send):
+        await respond(send)
+
+    client = Client(EMPTY_BODY)
+
+    await DeadlineMiddleware(app)(make_scope(), client.receive, client.send)
+
+    assert client.status == 200
+    assert client.sent[-1]["body"] == b"ok"
+
+
+@pytest.mark.asyncio
+async def test_request_without_a_body_gets_an_empty_one():
+    received = []
+
+    async def app(scope, receive, send):
+        received.append(await receive())
+        await respond(send)
+
+    # The server has not sent anything yet: the body comes from the middleware
+    client = Client()
+
+    await DeadlineMiddleware(app)(make_scope(), client.receive, client.send)
+
+    assert received == [EMPTY_BODY]
+    assert client.status == 200
+
+
+@pytest.mark.asyncio
+async def test_request_body_is_streamed_through():
+    received = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            received.append(message["body"])
+            if not message.get("more_body", False):
+                break
+        await respond(send)
+
+    client = Client(
+        {"type": "http.request", "body": b'{"a":', "more_body": True},
+        {"type": "http.request", "body": b" 1}", "more_body": False},
+    )
+    scope = make_scope("POST", "/api/v1/orders/", headers={"Content-Length": "8"})
+
+    await DeadlineMiddleware(app)(scope, client.receive, client.send)
+
+    assert received == [b'{"a":', b" 1}"]
+    assert client.status == 200
+
+
+@pytest.mark.asyncio
+async def test_watcher_stops_on_messages_other_than_disconnect():
+    calls = 0
+
+    async def receive():
+        # Out of protocol: another body, and never waiting
+        nonlocal calls
+        calls += 1
+        return EMPTY_BODY
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0.01)
+        await respond(send)
+
+    client = Client()
+
+    await asyncio.wait_for(DeadlineMiddleware(app)(make_scope(), receive, client.send), timeout=1.0)
+
+    assert calls == 2
+    assert client.status == 200
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("header, expected", [("2.5", 2.5), ("1000", 60.0), ("-1", 0.0), ("soon", 5.0), ("nan", 5.0), ("inf", 5.0), ("-inf", 5.0)])
+async def test_deadline_comes_from_the_header(header, expected):
+    deadlines = []
+
+    async def app(scope, receive, send):
+        deadlines.append(current_deadline.get() - time.monotonic())
+        await respond(send)
+
+    client = Client(EMPTY_BODY)
+    scope = make_scope(headers={"X-Request-Timeout": header})
+
+    await DeadlineMiddleware(app)(scope, client.receive, client.send)
+
+    # Capped at DEADLINE_MAX, and the route class default when unusable
+    assert deadlines[0] == pytest.approx(expected, abs=0.1)
@@ -0,0 +1,61 @@
+import pytest
+
+from app.exceptions.custom_exceptions import DeadlineExceededException
+from app.utils import deadlines
+from app.utils.deadlines import apply_statement_timeout, current_deadline, time_left
+
+
+class Connection:
+    def __init__(self):
+        self.statements = []
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def deadline(clock):
+    def set_deadline(seconds_left):
+        token = current_deadline.set(None if seconds_left is None else clock.now + seconds_left)
+        tokens.append(token)
+
+    tokens = []
+    yield set_deadline
+    for token in reversed(tokens):
+        current_deadline.reset(token)
+
+
+def test_time_left_counts_down_to_the_deadline(deadline, clock):
+    deadline(2.0)
+    assert time_left("database") == pytest.approx(2.0)
+
+    clock.now += 2.0
+    with pytest.raises(DeadlineExceededException):
+        time_left("database")
+
+
+def test_time_left_without_a_deadline(deadline):
+    deadline(None)
+
+    assert time_left("database") is None
+
+
+@pytest.mark.parametrize("seconds_left", [None, 1.0, 5.0])
+def test_statement_timeout_not_set_with_time_to_spare(deadline, monkeypatch, seconds_left):
+    monkeypatch.setattr(deadlines.settings, "DEADLINE_STATEMENT_TIMEOUT_THRESHOLD", 1.0)
+    connection = Connection()
+    deadline(seconds_left)
+
+    apply_statement_timeout(None, None, connection)
+
+    assert connection.statements == []
+
+
+def test_statement_timeout_set_close_to_the_deadline(deadline, monkeypatch):
+    monkeypatch.setattr(deadlines.settings, "DEADLINE_STATEMENT_TIMEOUT_THRESHOLD", 1.0)
+    connection = Connection()
+    deadline(0.25)
+
+    apply_statement_timeout(None, None, connection)
+
+    assert connection.statements == ["SET LOCAL statement_timeout = 250"]
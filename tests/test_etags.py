@@ -0,0 +1,83 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from app.utils.etags import (
+    encoded_etag,
+    expected_versions,
+    none_match,
+    order_etag,
+    orders_list_etag,
+    rows_list_etag,
+)
+
+
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+Row = namedtuple("Row", "id updated_at")
+
+
+def test_order_etag_changes_with_updated_at():
+    etag = order_etag(7, UPDATED_AT)
+
+    assert etag.startswith('"7-') and etag.endswith('"')
+    assert order_etag(7, UPDATED_AT.replace(microsecond=123457)) != etag
+
+
+def test_list_etag_changes_with_the_rows():
+    etag = orders_list_etag(1, 3, UPDATED_AT, 6)
+
+    assert orders_list_etag(1, 3, UPDATED_AT, 6) == etag
+    assert orders_list_etag(2, 3, UPDATED_AT, 6) != etag
+    assert orders_list_etag(1, 2, UPDATED_AT, 6) != etag
+    assert orders_list_etag(1, 3, UPDATED_AT, 7) != etag
+    assert orders_list_etag(1, 0, None, 0).startswith('"')
+
+
+def test_rows_list_etag_matches_the_summary_etag():
+    rows = [Row(1, UPDATED_AT.replace(second=1)), Row(2, UPDATED_AT), Row(3, UPDATED_AT.replace(second=2))]
+
+    assert rows_list_etag(1, rows) == orders_list_etag(1, 3, UPDATED_AT, 6)
+    assert rows_list_etag(1, []) == orders_list_etag(1, 0, None, 0)
+
+
+def test_encoded_etag_appends_the_coding_to_strong_etags():
+    assert encoded_etag('"7-123"', "gzip") == '"7-123-gzip"'
+    assert encoded_etag('W/"7-123"', "br") == 'W/"7-123"'
+
+
+def test_none_match_uses_weak_comparison():
+    etag = order_etag(7, UPDATED_AT)
+
+    assert none_match(etag, etag)
+    assert none_match(f"W/{etag}", etag)
+    assert none_match(f'"other", {etag}', etag)
+    assert none_match("*", etag)
+    assert not none_match('"other"', etag)
+
+
+def test_none_match_accepts_encoded_etags():
+    etag = order_etag(7, UPDATED_AT)
+
+    for coding in ("gzip", "br", "zstd"):
+        assert none_match(encoded_etag(etag, coding), etag)
+    assert none_match(encoded_etag(orders_list_etag(1, 0, None, 0), "gzip"), orders_list_etag(1, 0, None, 0))
+
+
+def test_expected_versions_reads_strong_etags_of_the_order():
+    etag = order_etag(7, UPDATED_AT)
+
+    assert expected_versions(etag, 7) == [UPDATED_AT]
+    assert expected_versions(encoded_etag(etag, "zstd"), 7) == [UPDATED_AT]
+    assert expected_versions(f'{etag}, "7-0"', 7) == [UPDATED_AT, datetime(1970, 1, 1, tzinfo=timezone.utc)]
+
+
+def test_expected_versions_never_matches_weak_or_foreign_etags():
+    etag = order_etag(7, UPDATED_AT)
+
+    assert expected_versions(f"W/{etag}", 7) == []
+    assert expected_versions(etag, 8) == []
+    assert expected_versions('"garbage"', 7) == []
+
+
+def test_expected_versions_without_precondition():
+    assert expected_versions(None, 7) is None
+    assert expected_versions("*", 7) is None
@@ -0,0 +1,178 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import create_engine, delete, func, select
+
+from app import database
+from app.crud.idempotency import (
+    claim_idempotency_key,
+    delete_expired_idempotency_keys,
+    get_idempotency_record,
+    idempotency_table,
+    store_idempotent_response,
+)
+from app.database import Database, commit, session_scope
+from app.services import idempotency
+from app.services.idempotency import purge_expired_keys, replay_response
+
+
+# A local database the idempotency_keys table can be created in, to run
+# the key claims against real row locks
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+needs_database = pytest.mark.skipif(not DATABASE_URL, reason="needs TEST_DATABASE_URL")
+
+CUSTOMER_ID = -4242
+
+
+def stored(**overrides) -> SimpleNamespace:
+    return SimpleNamespace(**{
+        "request_hash": "payload",
+        "token_hash": "token",
+        "status_code": 201,
+        "response_body": b'{"id": 1}',
+        "response_headers": {"ETag": '"1-100"'},
+        **overrides,
+    })
+
+
+def test_replay_returns_the_stored_response():
+    response = replay_response(stored(), "payload")
+
+    assert response.status_code == 201
+    assert response.body == b'{"id": 1}'
+    assert response.headers["ETag"] == '"1-100"'
+    assert response.headers["Idempotent-Replayed"] == "true"
+
+
+def test_key_reused_for_another_payload_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        replay_response(stored(), "another payload")
+
+    assert error.value.status_code == 422
+
+
+@pytest.mark.parametrize("record", [None, stored(status_code=None)])
+def test_key_without_a_response_asks_for_a_retry(record):
+    with pytest.raises(HTTPException) as error:
+        replay_response(record, "payload")
+
+    assert error.value.status_code == 409
+
+
+@pytest.fixture(scope="module")
+def keys_table():
+    engine = create_engine(DATABASE_URL)
+    idempotency_table.create(engine, checkfirst=True)
+    yield idempotency_table
+    engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def db(keys_table):
+    test_database = Database("test", DATABASE_URL)
+    yield test_database
+    async with session_scope(test_database) as session:
+        await database.execute(session, delete(keys_table).where(keys_table.c.customer_id == CUSTOMER_ID))
+        await commit(session)
+    await test_database.dispose()
+
+
+async def stored_keys(db: Database) -> int:
+    # Expired keys included, which get_idempotency_record hides
+    async with session_scope(db) as session:
+        count = select(func.count()).where(idempotency_table.c.customer_id == CUSTOMER_ID)
+        return (await database.execute(session, count)).scalar()
+
+
+async def claim(session, key: str, request_hash: str = "payload", ttl: float = 60) -> bool:
+    return await claim_idempotency_key(session, CUSTOMER_ID, key, request_hash, "token", ttl)
+
+
+@needs_database
+@pytest.mark.asyncio
+async def test_concurrent_claim_waits_for_the_first_to_commit(db):
+    async with session_scope(db) as first, session_scope(db) as second:
+        assert await claim(first, "key")
+
+        duplicate = asyncio.create_task(claim(second, "key"))
+        await asyncio.sleep(0.2)
+        # Blocked on the first claim's row
+        assert not duplicate.done()
+
+        await store_idempotent_response(first, CUSTOMER_ID, "key", 201, b'{"id": 1}', {})
+        await commit(first)
+
+        assert not await duplicate
+        record = await get_idempotency_record(second, CUSTOMER_ID, "key")
+        assert replay_response(record, "payload").body == b'{"id": 1}'
+
+
+@needs_database
+@pytest.mark.asyncio
+async def test_concurrent_claim_runs_once_the_first_rolls_back(db):
+    async with session_scope(db) as second:
+        async with session_scope(db) as first:
+            assert await claim(first, "key")
+            duplicate = asyncio.create_task(claim(second, "key"))
+            await asyncio.sleep(0.2)
+            assert not duplicate.done()
+        # Closing the first session rolled its claim back
+
+        assert await duplicate
+
+
+@needs_database
+@pytest.mark.asyncio
+async def test_expired_key_is_claimed_again(db):
+    async with session_scope(db) as session:
+        assert await claim(session, "key", ttl=-1)
+        await commit(session)
+
+        assert await get_idempotency_record(session, CUSTOMER_ID, "key") is None
+        assert await claim(session, "key", request_hash="another payload")
+        await commit(session)
+
+        record = await get_idempotency_record(session, CUSTOMER_ID, "key")
+        assert record.request_hash == "another payload"
+        assert record.status_code is None
+
+
+@needs_database
+@pytest.mark.asyncio
+async def test_expired_keys_are_purged_in_batches(db):
+    async with session_scope(db) as session:
+        # Whatever other expired keys the database holds go first
+        while await delete_expired_idempotency_keys(session, batch_size=100):
+            pass
+        for index in range(3):
+            await claim(session, f"expired-{index}", ttl=-1)
+        await claim(session, "live")
+        await commit(session)
+
+        assert await delete_expired_idempotency_keys(session, batch_size=2) == 2
+        assert await delete_expired_idempotency_keys(session, batch_size=2) == 1
+        assert await get_idempotency_record(session, CUSTOMER_ID, "live") is not None
+
+
+@needs_database
+@pytest.mark.asyncio
+async def test_purge_task_deletes_expired_keys(db, monkeypatch):
+    monkeypatch.setattr(idempotency, "session_scope", lambda: session_scope(db))
+    async with session_scope(db) as session:
+        await claim(session, "expired", ttl=-1)
+        await commit(session)
+
+    purge = asyncio.create_task(purge_expired_keys(interval=60, batch_size=10))
+    try:
+        for _ in range(50):
+            await asyncio.sleep(0.05)
+            if not await stored_keys(db):
+                break
+    finally:
+        purge.cancel()
+
+    assert await stored_keys(db) == 0
@@ -0,0 +1,85 @@
+import logging
+import queue
+import sys
+
+import pytest
+
+from app.utils import logger as logger_module
+from app.utils.logger import (
+    BatchedRotatingFileHandler,
+    DropCountingQueueHandler,
+    setup_logger,
+    shutdown_logging,
+)
+
+
+def make_record(msg, args=(), exc_info=None):
+    return logging.LogRecord("test", logging.ERROR, __file__, 1, msg, args, exc_info)
+
+
+def test_queued_record_keeps_its_arguments_as_they_were():
+    log_queue = queue.Queue()
+    handler = DropCountingQueueHandler(log_queue)
+    items = ["a"]
+
+    handler.handle(make_record("items: %s", (items,)))
+    items.append("b")
+
+    assert log_queue.get_nowait().getMessage() == "items: ['a']"
+
+
+def test_queued_record_keeps_the_exception_for_the_listener():
+    log_queue = queue.Queue()
+    handler = DropCountingQueueHandler(log_queue)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        handler.handle(make_record("failed", exc_info=sys.exc_info()))
+
+    record = log_queue.get_nowait()
+    assert record.msg == "failed"
+    assert record.exc_info[0] is ValueError
+
+
+def test_file_rolls_over_at_the_tracked_size(tmp_path):
+    log_file = tmp_path / "app.log"
+    handler = BatchedRotatingFileHandler(log_file, maxBytes=25, backupCount=1)
+    try:
+        for msg in ["first line", "second line", "third line"]:
+            handler.emit(make_record(msg))
+        handler.flush()
+    finally:
+        handler.close()
+
+    assert (tmp_path / "app.log.1").read_text() == "first line\nsecond line\n"
+    assert log_file.read_text() == "third line\n"
+
+
+def test_size_of_an_existing_file_counts_towards_rollover(tmp_path):
+    log_file = tmp_path / "app.log"
+    log_file.write_text("x" * 20 + "\n")
+    handler = BatchedRotatingFileHandler(log_file, maxBytes=25, backupCount=1)
+    try:
+        handler.emit(make_record("next line"))
+    finally:
+        handler.close()
+
+    assert log_file.read_text() == "next line\n"
+
+
+@pytest.fixture
+def logger_name():
+    yield "test-setup-logger"
+    shutdown_logging()
+    logging.getLogger("test-setup-logger").handlers.clear()
+
+
+def test_setup_logger_twice_starts_one_writer(logger_name):
+    writers = len(logger_module._listeners)
+
+    first = setup_logger(name=logger_name, queue_size=10)
+    second = setup_logger(name=logger_name, queue_size=10)
+
+    assert second is first
+    assert len(first.handlers) == 1
+    assert len(logger_module._listeners) == writers + 1
@@ -0,0 +1,176 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+from app.routes import orders as order_routes
+from app.services import order_cache as order_cache_module
+from app.services.order_cache import MemoryOrderCacheBackend, OrderCache, RedisOrderCacheBackend
+from app.utils.responses import ORDER_READ_FIELDS
+
+
+OrderRow = namedtuple("OrderRow", ORDER_READ_FIELDS)
+
+
+def make_row(order_id: int = 1, customer_id: int = 7, quantity: int = 1) -> OrderRow:
+    moment = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return OrderRow(
+        product_id=3, quantity=quantity, price=9.5, id=order_id, customer_id=customer_id,
+        status="pending", created_at=moment, updated_at=moment,
+    )
+
+
+class Loader:
+    """
+    Stand-in for the database read, counting its calls
+    """
+
+    def __init__(self, row):
+        self.row = row
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.row
+
+
+class BrokenBackend:
+    async def version(self, order_id):
+        raise ConnectionError("cache is down")
+
+    get = set = bump = version
+
+
+@pytest.fixture
+def cache():
+    return OrderCache(MemoryOrderCacheBackend(max_size=100, ttl=30))
+
+
+@pytest.mark.asyncio
+async def test_hit_does_not_reload(cache):
+    loader = Loader(make_row())
+
+    first = await cache.get_or_load(1, loader)
+    second = await cache.get_or_load(1, loader)
+
+    assert loader.calls == 1
+    assert second == first
+    assert orjson.loads(second.payload)["quantity"] == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_order_is_not_cached(cache):
+    loader = Loader(None)
+
+    assert await cache.get_or_load(1, loader) is None
+    assert await cache.get_or_load(1, loader) is None
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_invalidation_bumps_the_version(cache):
+    await cache.get_or_load(1, Loader(make_row()))
+
+    await cache.invalidate(1)
+    order = await cache.get_or_load(1, Loader(make_row(quantity=5)))
+
+    assert orjson.loads(order.payload)["quantity"] == 5
+
+
+@pytest.mark.asyncio
+async def test_row_read_before_a_concurrent_write_is_not_served(cache):
+    async def load_then_write():
+        # The write lands after this read, while it is being cached
+        row = make_row()
+        await cache.invalidate(1)
+        return row
+
+    await cache.get_or_load(1, load_then_write)
+    order = await cache.get_or_load(1, Loader(make_row(quantity=5)))
+
+    assert orjson.loads(order.payload)["quantity"] == 5
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_per_order(cache):
+    other = Loader(make_row(order_id=2))
+    await cache.get_or_load(1, Loader(make_row()))
+    await cache.get_or_load(2, other)
+
+    await cache.invalidate(1)
+    await cache.get_or_load(2, other)
+
+    assert other.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_broken_backend_falls_back_to_the_database():
+    cache = OrderCache(BrokenBackend())
+    loader = Loader(make_row())
+
+    for _ in range(2):
+        assert (await cache.get_or_load(1, loader)).customer_id == 7
+    await cache.invalidate(1)
+
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_unreachable_redis_falls_back_to_the_database():
+    cache = OrderCache(RedisOrderCacheBackend("redis://127.0.0.1:1/0", max_size=100, ttl=30))
+    loader = Loader(make_row())
+    try:
+        assert (await cache.get_or_load(1, loader)).customer_id == 7
+        await cache.invalidate(1)
+    finally:
+        await cache.close()
+
+    assert loader.calls == 1
+
+
+@pytest.fixture
+def cached_order(monkeypatch, cache):
+    async def verified(current_user):
+        pass
+
+    monkeypatch.setattr(order_cache_module, "order_cache", cache)
+    monkeypatch.setattr(order_routes, "ensure_user_exists", verified)
+    return cache
+
+
+async def get_order_details(order_id: int, user_id: int):
+    return await order_routes.get_order_details(
+        order_id=order_id, if_none_match=None, current_user={"user_id": user_id, "token": "token"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_cached_order_is_served_to_its_owner(cached_order):
+    await cached_order.get_or_load(1, Loader(make_row(customer_id=7)))
+
+    response = await get_order_details(1, user_id=7)
+
+    assert orjson.loads(response.body)["customer_id"] == 7
+
+
+@pytest.mark.asyncio
+async def test_cached_order_of_another_customer_is_denied(cached_order):
+    await cached_order.get_or_load(1, Loader(make_row(customer_id=7)))
+
+    with pytest.raises(HTTPException) as error:
+        await get_order_details(1, user_id=8)
+
+    assert error.value.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_cache_hit_opens_no_session(cached_order, monkeypatch):
+    opened = []
+    monkeypatch.setattr(order_routes, "session_scope", opened.append)
+    await cached_order.get_or_load(1, Loader(make_row(customer_id=7)))
+
+    await get_order_details(1, user_id=7)
+
+    assert opened == []
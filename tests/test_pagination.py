@@ -0,0 +1,45 @@
+import base64
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+
+    cursor = encode_cursor(created_at, 42)
+
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+def test_cursor_is_url_safe_and_unpadded():
+    cursor = encode_cursor(datetime(2024, 5, 1, tzinfo=timezone.utc), 1)
+
+    assert "=" not in cursor
+    assert all(char.isalnum() or char in "-_" for char in cursor)
+
+
+def test_naive_timestamps_round_trip():
+    created_at = datetime(2024, 5, 1, 12, 30)
+
+    assert decode_cursor(encode_cursor(created_at, 7)) == (created_at, 7)
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    base64.urlsafe_b64encode(b'{"id": 1}').decode(),
+    base64.urlsafe_b64encode(b'["2024-05-01T00:00:00", 1, 2]').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 1]').decode(),
+    base64.urlsafe_b64encode(b'["2024-05-01T00:00:00", "one"]').decode(),
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+
+    assert error.value.status_code == 400
+    assert error.value.detail == "Invalid pagination cursor"
@@ -0,0 +1,86 @@
+import pytest
+
+from app.utils.query_stats import QueryStats, fingerprint, repeated_queries
+
+
+@pytest.mark.parametrize("statement, expected", [
+    ("SELECT * FROM t WHERE id = 42", "SELECT * FROM t WHERE id = ?"),
+    ("SELECT * FROM t WHERE name = 'o''brien'", "SELECT * FROM t WHERE name = ?"),
+    ("SELECT * FROM t WHERE id = %(id_1)s", "SELECT * FROM t WHERE id = ?"),
+    ("SELECT * FROM t WHERE id = %s", "SELECT * FROM t WHERE id = ?"),
+    ("SELECT * FROM t WHERE id = $1", "SELECT * FROM t WHERE id = ?"),
+    ("SELECT *\n  FROM t\n WHERE price > -1.5", "SELECT * FROM t WHERE price > ?"),
+    ("SELECT * FROM t WHERE id IN (1, 2, 3)", "SELECT * FROM t WHERE id IN (?, ...)"),
+    ("SELECT * FROM t WHERE id IN ($1::INTEGER, $2::INTEGER)", "SELECT * FROM t WHERE id IN (?, ...)"),
+    (
+        "INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)",
+        "INSERT INTO t (a, b) VALUES (?, ...), ...",
+    ),
+])
+def test_fingerprint_normalizes_literals_and_parameters(statement, expected):
+    assert fingerprint(statement) == expected
+
+
+def test_fingerprint_keeps_identifiers_with_digits():
+    assert fingerprint("SELECT col1 FROM t2") == "SELECT col1 FROM t2"
+
+
+def test_in_lists_of_any_length_share_a_fingerprint():
+    assert fingerprint("SELECT * FROM t WHERE id IN (1, 2)") == fingerprint(
+        "SELECT * FROM t WHERE id IN (1, 2, 3, 4, 5)"
+    )
+
+
+def test_query_stats_aggregate_per_fingerprint():
+    stats = QueryStats(max_size=10)
+    stats.record("SELECT ?", 0.1, 1)
+    stats.record("SELECT ?", 0.3, 2)
+    stats.record("UPDATE t SET a = ?", 0.05, 1)
+
+    [select, update] = stats.top(10)
+
+    assert select["fingerprint"] == "SELECT ?"
+    assert select["calls"] == 2
+    assert select["total"] == pytest.approx(0.4)
+    assert select["mean"] == pytest.approx(0.2)
+    assert select["max"] == pytest.approx(0.3)
+    assert select["rows"] == 3
+    assert update["calls"] == 1
+
+
+def test_top_sorts_by_the_requested_field():
+    stats = QueryStats(max_size=10)
+    for _ in range(5):
+        stats.record("cheap", 0.01, 0)
+    stats.record("slow", 1.0, 0)
+
+    assert [entry["fingerprint"] for entry in stats.top(10, sort="calls")] == ["cheap", "slow"]
+    assert [entry["fingerprint"] for entry in stats.top(10, sort="max")] == ["slow", "cheap"]
+    assert len(stats.top(1)) == 1
+
+
+def test_cheapest_fingerprint_is_dropped_at_the_limit():
+    stats = QueryStats(max_size=2)
+    stats.record("a", 1.0, 0)
+    stats.record("b", 0.1, 0)
+
+    stats.record("c", 0.5, 0)
+
+    assert {entry["fingerprint"] for entry in stats.top(10)} == {"a", "c"}
+
+
+def test_reset_clears_the_stats():
+    stats = QueryStats(max_size=10)
+    stats.record("a", 1.0, 0)
+
+    stats.reset()
+
+    assert stats.top(10) == []
+
+
+def test_repeated_queries_reports_the_most_repeated_statement():
+    counts = {"SELECT a": 3, "SELECT b": 12}
+
+    assert repeated_queries(counts, threshold=10) == ("SELECT b", 12)
+    assert repeated_queries(counts, threshold=13) is None
+    assert repeated_queries({}, threshold=1) is None
@@ -0,0 +1,147 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.dependencies import rate_limit
+from app.utils.rate_limiter import MemoryTokenBucketStore, decide, retry_seconds
+
+
+def test_decide_takes_the_cost_when_there_are_enough_tokens():
+    tokens, decision = decide(10.0, rate=2.0, burst=10.0, cost=3.0)
+
+    assert tokens == 7.0
+    assert decision.allowed
+    assert decision.remaining == 7
+    assert decision.reset_after == pytest.approx(1.5)
+    assert decision.retry_after == 0.0
+    assert decision.window == pytest.approx(5.0)
+
+
+def test_decide_rejects_without_taking_tokens():
+    tokens, decision = decide(1.0, rate=2.0, burst=10.0, cost=3.0)
+
+    assert tokens == 1.0
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(1.0)
+
+
+def test_decide_lets_a_cost_above_the_burst_into_debt_on_a_full_bucket():
+    tokens, decision = decide(10.0, rate=2.0, burst=10.0, cost=25.0)
+
+    assert tokens == -15.0
+    assert decision.allowed
+    assert decision.remaining == 0
+    assert decision.reset_after == pytest.approx(12.5)
+
+
+def test_decide_makes_a_cost_above_the_burst_wait_for_a_full_bucket():
+    tokens, decision = decide(4.0, rate=2.0, burst=10.0, cost=25.0)
+
+    assert tokens == 4.0
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(3.0)
+
+
+def test_retry_seconds_rounds_up_to_at_least_one():
+    assert retry_seconds(0.0) == 1
+    assert retry_seconds(1.2) == 2
+
+
+@pytest.mark.asyncio
+async def test_bucket_allows_a_burst_then_refills(clock):
+    store = MemoryTokenBucketStore(shards=4, max_keys=100)
+
+    decisions = [await store.take("user:1", rate=1.0, burst=3) for _ in range(4)]
+
+    assert [decision.allowed for decision in decisions] == [True, True, True, False]
+    assert decisions[-1].retry_after == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert (await store.take("user:1", rate=1.0, burst=3)).allowed
+
+
+@pytest.mark.asyncio
+async def test_buckets_are_per_key(clock):
+    store = MemoryTokenBucketStore(shards=4, max_keys=100)
+
+    for _ in range(3):
+        await store.take("user:1", rate=1.0, burst=3)
+
+    assert not (await store.take("user:1", rate=1.0, burst=3)).allowed
+    assert (await store.take("user:2", rate=1.0, burst=3)).allowed
+
+
+@pytest.mark.asyncio
+async def test_cost_is_taken_at_once(clock):
+    store = MemoryTokenBucketStore(shards=4, max_keys=100)
+
+    assert (await store.take("user:1", rate=1.0, burst=10, cost=7)).remaining == 3
+    assert not (await store.take("user:1", rate=1.0, burst=10, cost=4)).allowed
+    assert (await store.take("user:1", rate=1.0, burst=10, cost=3)).allowed
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_bucket_goes_at_the_size_limit(clock):
+    store = MemoryTokenBucketStore(shards=1, max_keys=2)
+    await store.take("user:1", rate=1.0, burst=3)
+    await store.take("user:2", rate=1.0, burst=3)
+    await store.take("user:1", rate=1.0, burst=3)
+
+    await store.take("user:3", rate=1.0, burst=3)
+
+    # user:1 kept its bucket, user:2 starts over with a full one
+    assert (await store.take("user:1", rate=1.0, burst=3)).remaining == 0
+    assert (await store.take("user:2", rate=1.0, burst=3)).remaining == 2
+
+
+def make_request() -> Request:
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [], "state": {}})
+
+
+@pytest.fixture
+def write_limit(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit, "rate_limit_store", MemoryTokenBucketStore(shards=1, max_keys=100))
+    monkeypatch.setitem(rate_limit.LIMITS, "write", (1.0, 10))
+
+
+@pytest.mark.asyncio
+async def test_take_rate_limit_charges_the_cost(write_limit):
+    request = make_request()
+
+    await rate_limit.take_rate_limit(request, "write", 7, cost=8)
+
+    assert request.state.rate_limit.remaining == 2
+    with pytest.raises(HTTPException) as error:
+        await rate_limit.take_rate_limit(request, "write", 7, cost=3)
+    assert error.value.status_code == 429
+    assert error.value.headers["Retry-After"] == "1"
+
+
+@pytest.mark.asyncio
+async def test_take_rate_limit_lets_a_batch_above_the_burst_pay_later(write_limit, clock):
+    request = make_request()
+
+    await rate_limit.take_rate_limit(request, "write", 7, cost=25)
+
+    assert request.state.rate_limit.remaining == 0
+    with pytest.raises(HTTPException) as error:
+        await rate_limit.take_rate_limit(request, "write", 7)
+    # The 15 tokens of debt are paid off first
+    assert error.value.headers["Retry-After"] == "16"
+
+    clock.now += 16
+    await rate_limit.take_rate_limit(request, "write", 7)
+
+
+@pytest.mark.asyncio
+async def test_take_rate_limit_fails_open(monkeypatch):
+    class BrokenStore:
+        async def take(self, *args, **kwargs):
+            raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(rate_limit, "rate_limit_store", BrokenStore())
+    request = make_request()
+
+    await rate_limit.take_rate_limit(request, "write", 7)
+
+    assert not hasattr(request.state, "rate_limit")
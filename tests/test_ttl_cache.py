@@ -0,0 +1,181 @@
+import asyncio
+
+import pytest
+
+from app.exceptions.custom_exceptions import DeadlineExceededException
+from app.utils.ttl_cache import MISSING, TTLCache
+
+
+def test_get_and_set():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+
+    assert cache.get("a") is MISSING
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+
+def test_entries_expire(clock):
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=120)
+
+    clock.now += 60
+
+    assert cache.get("a") is MISSING
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_non_positive_ttl_is_not_stored():
+    cache = TTLCache(name="test", max_size=10, ttl=0)
+
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=-1)
+
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(name="test", max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+@pytest.mark.asyncio
+async def test_get_or_load_stores_the_loaded_value():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        return "value"
+
+    assert await cache.get_or_load("a", loader) == "value"
+    assert await cache.get_or_load("a", loader) == "value"
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_for_decides_the_ttl_of_the_loaded_value(clock):
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+
+    async def loader():
+        return False
+
+    await cache.get_or_load("a", loader, ttl_for=lambda value: 5 if value is False else 60)
+    clock.now += 5
+
+    assert cache.get("a") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    release = asyncio.Event()
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "value"
+
+    tasks = [asyncio.create_task(cache.get_or_load("a", loader)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["value"] * 5
+    assert calls == 1
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_waiter_and_are_not_cached():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    release = asyncio.Event()
+
+    async def failing():
+        await release.wait()
+        raise RuntimeError("upstream down")
+
+    tasks = [asyncio.create_task(cache.get_or_load("a", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("a") is MISSING
+
+
+@pytest.mark.asyncio
+async def test_waiters_reload_when_the_loading_caller_is_cancelled():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    started = asyncio.Event()
+
+    async def hanging():
+        started.set()
+        await asyncio.Event().wait()
+
+    async def loader():
+        return "value"
+
+    first = asyncio.create_task(cache.get_or_load("a", hanging))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await waiter == "value"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_load():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    release = asyncio.Event()
+
+    async def loader():
+        await release.wait()
+        return "value"
+
+    first = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("a", loader))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    release.set()
+
+    assert await first == "value"
+    assert waiter.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_waiters_reload_on_retry_on_errors():
+    cache = TTLCache(name="test", max_size=10, ttl=60)
+    release = asyncio.Event()
+
+    async def out_of_time():
+        await release.wait()
+        raise DeadlineExceededException()
+
+    async def loader():
+        return "value"
+
+    retry_on = (DeadlineExceededException,)
+    first = asyncio.create_task(cache.get_or_load("a", out_of_time, retry_on=retry_on))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(cache.get_or_load("a", loader, retry_on=retry_on))
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await waiter == "value"
+    with pytest.raises(DeadlineExceededException):
+        await first
@@ -0,0 +1,47 @@
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.middleware.metrics_middleware import USERS_SERVICE_REQUESTS_IN_FLIGHT
+from app.services import user_service
+
+
+def in_flight() -> float:
+    return USERS_SERVICE_REQUESTS_IN_FLIGHT._value.get()
+
+
+def users_service(monkeypatch, respond):
+    seen = []
+
+    def handler(request):
+        seen.append(in_flight())
+        return respond(request)
+
+    client = httpx.AsyncClient(base_url="http://users", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(user_service, "_client", client)
+    return seen
+
+
+@pytest.mark.asyncio
+async def test_request_counts_as_in_flight_until_it_completes(monkeypatch):
+    seen = users_service(monkeypatch, lambda request: httpx.Response(200, json={"id": 7}))
+    before = in_flight()
+
+    assert await user_service._fetch_user_exists(7, "token") is True
+
+    assert seen == [before + 1]
+    assert in_flight() == before
+
+
+@pytest.mark.asyncio
+async def test_failed_request_is_no_longer_in_flight(monkeypatch):
+    def refuse(request):
+        raise httpx.ConnectError("refused")
+
+    users_service(monkeypatch, refuse)
+    before = in_flight()
+
+    with pytest.raises(HTTPException):
+        await user_service._fetch_user_exists(7, "token")
+
+    assert in_flight() == before